@@ -0,0 +1,165 @@
+import os
+import json
+import struct
+import numpy as np
+from geom_helpers import RT_from_world_matrices, quat_from_rotmat
+from gt_store import GTStore
+
+# Export of the ground truth cameras of a run (intrinsics and every frame's extrinsics, read
+# from the binary gt store, see gt_store.py) for reconstruction tools, in one shot:
+#   'colmap_txt'/'colmap_bin'  cameras, images, points3D (empty) of a COLMAP sparse model
+#   'opencv'                   cameras.yml (cv::FileStorage) with K, image size and N x 12 [R|t] rows
+#   'json'                     camera_params.json in the layout of the template file
+# Extrinsics are world to cv camera transforms (x right, y down, z forward). Exports are
+# skipped when they are up to date with the store (export.json holds its fingerprint).
+
+EXPORT_FORMATS = ['colmap_txt', 'colmap_bin', 'opencv', 'json']
+COLMAP_PINHOLE = 1 # model id of PINHOLE: fx fy cx cy
+
+# ----------------------------------------------------------
+def get_image_names(frame_ids, fmt='cysto_{:06d}.jpg'):
+    return [fmt.format(int(i)) for i in frame_ids]
+
+def get_extrinsics(store):
+    # frame ids, world to cv camera rotations N x 3 x 3 and translations N x 3 of the done frames
+    frame_ids = store.get_done_ids()
+    RT = RT_from_world_matrices(store.get('cam_wmat', frame_ids))
+    return frame_ids, RT[:, :3, :3], RT[:, :3, 3]
+
+def write_colmap_txt(out_dir, K, width, height, names, R, t):
+    q = quat_from_rotmat(R) # x y z w
+    file = open(out_dir + '/cameras.txt', "w")
+    file.write('# Camera list with one line of data per camera:\n#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n')
+    file.write('1 PINHOLE ' + str(width) + ' ' + str(height) + ' ' + ' '.join(repr(float(_)) for _ in \
+               [K[0, 0], K[1, 1], K[0, 2], K[1, 2]]) + '\n')
+    file.close()
+    lines = ['# Image list with two lines of data per image:', \
+             '#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME', '#   POINTS2D[] as (X, Y, POINT3D_ID)']
+    rows = np.hstack([q[:, [3, 0, 1, 2]], t])
+    for k, (row, name) in enumerate(zip(rows, names)):
+        lines.append(str(k + 1) + ' ' + ' '.join(repr(float(_)) for _ in row) + ' 1 ' + name)
+        lines.append('')
+    file = open(out_dir + '/images.txt', "w")
+    file.write('\n'.join(lines) + '\n')
+    file.close()
+    file = open(out_dir + '/points3D.txt', "w")
+    file.write('# 3D point list with one line of data per point:\n')
+    file.close()
+
+def write_colmap_bin(out_dir, K, width, height, names, R, t):
+    q = quat_from_rotmat(R)
+    file = open(out_dir + '/cameras.bin', "wb")
+    file.write(struct.pack('<Q', 1))
+    file.write(struct.pack('<iiQQ4d', 1, COLMAP_PINHOLE, width, height, K[0, 0], K[1, 1], K[0, 2], K[1, 2]))
+    file.close()
+    file = open(out_dir + '/images.bin', "wb")
+    file.write(struct.pack('<Q', len(names)))
+    for k, (qk, tk, name) in enumerate(zip(q, t, names)):
+        file.write(struct.pack('<i7di', k + 1, qk[3], qk[0], qk[1], qk[2], tk[0], tk[1], tk[2], 1))
+        file.write(name.encode() + b'\x00')
+        file.write(struct.pack('<Q', 0)) # no 2D points
+    file.close()
+    file = open(out_dir + '/points3D.bin', "wb")
+    file.write(struct.pack('<Q', 0))
+    file.close()
+
+def _yaml_matrix(name, M, fmt='%.17g'):
+    M = np.atleast_2d(M)
+    data = ', '.join(fmt % _ for _ in M.ravel())
+    return name + ': !!opencv-matrix\n   rows: ' + str(M.shape[0]) + '\n   cols: ' + str(M.shape[1]) + \
+           '\n   dt: d\n   data: [ ' + data + ' ]\n'
+
+def write_opencv_yaml(out_dir, K, width, height, frame_ids, R, t):
+    extrinsics = np.hstack([R.reshape(-1, 9), t]) if len(R) else np.zeros((0, 12))
+    file = open(out_dir + '/cameras.yml', "w")
+    file.write('%YAML:1.0\n---\n')
+    file.write('image_width: ' + str(width) + '\nimage_height: ' + str(height) + '\n')
+    file.write(_yaml_matrix('camera_matrix', K))
+    file.write(_yaml_matrix('distortion_coefficients', np.zeros((1, 5))))
+    file.write(_yaml_matrix('frame_ids', np.asarray(frame_ids, dtype=np.float64).reshape(-1, 1), '%d'))
+    file.write(_yaml_matrix('extrinsics', extrinsics)) # one row per frame: r00 r01 ... r22 t0 t1 t2
+    file.close()
+
+# ----------------------------------------------------------
+# keys of the json template that get the values of the run, any other key is kept as it is
+JSON_KEYS = {'fx': lambda K, w, h: K[0, 0], 'fy': lambda K, w, h: K[1, 1], 'cx': lambda K, w, h: K[0, 2], \
+             'cy': lambda K, w, h: K[1, 2], 'width': lambda K, w, h: w, 'height': lambda K, w, h: h, \
+             'image_width': lambda K, w, h: w, 'image_height': lambda K, w, h: h, \
+             'K': lambda K, w, h: K.tolist(), 'camera_matrix': lambda K, w, h: K.tolist(), \
+             'intrinsics': lambda K, w, h: K.tolist()}
+
+def _fill_json(template, K, width, height, replaced):
+    if isinstance(template, dict):
+        filled = {}
+        for key, value in template.items():
+            if key in JSON_KEYS and not isinstance(value, dict):
+                new = JSON_KEYS[key](K, width, height)
+                filled[key] = new if isinstance(new, (int, list)) else float(new)
+                replaced.append(key)
+            else:
+                filled[key] = _fill_json(value, K, width, height, replaced)
+        return filled
+    if isinstance(template, list):
+        return [_fill_json(value, K, width, height, replaced) for value in template]
+    return template
+
+def fill_json_template(template, K, width, height):
+    # recursively replaces the values of JSON_KEYS, keeping the layout of the template; a template
+    # without any of them would be copied with its own intrinsics, which is an error
+    replaced = []
+    filled = _fill_json(template, K, width, height, replaced)
+    if not replaced:
+        raise ValueError('Camera json template has none of the keys ' + ', '.join(JSON_KEYS))
+    return filled
+
+def write_camera_params_json(filepath, K, width, height, template_fp=None):
+    template = {'fx': 0.0, 'fy': 0.0, 'cx': 0.0, 'cy': 0.0, 'width': 0, 'height': 0}
+    if template_fp is not None and os.path.exists(template_fp):
+        file = open(template_fp, "r")
+        template = json.load(file)
+        file.close()
+    file = open(filepath, "w")
+    json.dump(fill_json_template(template, K, width, height), file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+
+# ----------------------------------------------------------
+def get_store_fingerprint(store_dir):
+    return {name: [os.path.getsize(store_dir + '/' + name), os.path.getmtime(store_dir + '/' + name)] \
+            for name in ['cam_wmat.npy', 'done.npy', 'K.npy', 'meta.json']}
+
+def export_cameras(store_dir, out_dir, formats=EXPORT_FORMATS, name_fmt='cysto_{:06d}.jpg', json_fp=None, \
+                   json_template_fp=None, force=False):
+    # writes the requested formats to out_dir (camera_params.json to json_fp, default out_dir/camera_params.json)
+    # unless export.json says they were already written from the same store content
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    json_fp = json_fp or out_dir + '/camera_params.json'
+    state = {'store': os.path.abspath(store_dir), 'fingerprint': get_store_fingerprint(store_dir), \
+             'formats': sorted(formats), 'name_fmt': name_fmt, 'json_fp': os.path.abspath(json_fp), \
+             'json_template_fp': json_template_fp}
+    state_fp = out_dir + '/export.json'
+    if not force and os.path.exists(state_fp):
+        file = open(state_fp, "r")
+        cached = json.load(file)
+        file.close()
+        if cached == json.loads(json.dumps(state)):
+            return False
+
+    store = GTStore(store_dir)
+    K = store.K
+    width, height = store.meta['resolution']
+    frame_ids, R, t = get_extrinsics(store)
+    names = get_image_names(frame_ids, name_fmt)
+    if 'colmap_txt' in formats:
+        write_colmap_txt(out_dir, K, width, height, names, R, t)
+    if 'colmap_bin' in formats:
+        write_colmap_bin(out_dir, K, width, height, names, R, t)
+    if 'opencv' in formats:
+        write_opencv_yaml(out_dir, K, width, height, frame_ids, R, t)
+    if 'json' in formats:
+        write_camera_params_json(json_fp, K, width, height, json_template_fp)
+    store.close()
+    file = open(state_fp, "w")
+    json.dump(state, file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+    return True
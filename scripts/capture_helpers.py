@@ -0,0 +1,51 @@
+import bpy
+import numpy as np
+
+# Capture of the composited render result into numpy, without writing/reading image files.
+# A Viewer node is fed with the same input as the Composite node, Blender stores its
+# result in the 'Viewer Node' image whose pixels are copied into a preallocated buffer.
+
+VIEWER_NODE_ID = 'Capture Viewer'
+
+def get_capture_viewer_node(scene):
+    tree = scene.node_tree
+    composite = [node for node in tree.nodes if node.type == 'COMPOSITE'][0]
+    if not composite.inputs['Image'].links:
+        raise ValueError('Composite node has no input to capture')
+    source = composite.inputs['Image'].links[0].from_socket
+    viewer = tree.nodes.get(VIEWER_NODE_ID)
+    if viewer is None:
+        viewer = tree.nodes.new('CompositorNodeViewer')
+        viewer.name = VIEWER_NODE_ID
+        viewer.use_alpha = True
+    if not viewer.inputs['Image'].links or viewer.inputs['Image'].links[0].from_socket != source:
+        tree.links.new(source, viewer.inputs['Image'])
+    tree.nodes.active = viewer # the active viewer is the one that gets evaluated
+    return viewer
+
+def get_srgb8_settings(scene):
+    # {'exposure', 'gamma'} of the scene's color management for sink_helpers.linear_to_srgb8, None if
+    # the view can't be reproduced in numpy (Filmic and other view transforms, looks, curves)
+    view = scene.view_settings
+    if scene.display_settings.display_device != 'sRGB' or view.view_transform != 'Standard' or view.look != 'None' \
+       or view.use_curve_mapping:
+        return None
+    return {'exposure': view.exposure, 'gamma': view.gamma}
+
+class RenderCapture:
+    def __init__(self, scene=None):
+        self.scene = bpy.context.scene if scene is None else scene
+        get_capture_viewer_node(self.scene)
+        scale = self.scene.render.resolution_percentage / 100
+        self.width = int(self.scene.render.resolution_x * scale)
+        self.height = int(self.scene.render.resolution_y * scale)
+        self.buffer = np.empty(self.width * self.height * 4, dtype=np.float32)
+
+    def grab(self):
+        # HxWx4 float32 RGBA (scene linear) view of the last render, top row first;
+        # the buffer is reused, so the view is only valid until the next grab
+        pixels = bpy.data.images['Viewer Node'].pixels
+        if len(pixels) != len(self.buffer):
+            raise ValueError('Viewer node result doesn\'t match render resolution')
+        pixels.foreach_get(self.buffer) # single copy into the preallocated buffer
+        return self.buffer.reshape(self.height, self.width, 4)[::-1]
@@ -0,0 +1,125 @@
+import json
+import numpy as np
+from projection_helpers import project_trajectory
+
+# Surface coverage of a trajectory, pure numpy: which frames observe each face of the model,
+# at which viewing angle and distance, how much of the surface is seen and which frames are
+# redundant. The index is kept in CSR form: the observations of face f are the rows
+# offsets[f]:offsets[f+1] of the frame/angle/distance arrays.
+
+# ----------------------------------------------------------
+def get_face_geometry(vertices, faces):
+    # centroids F x 3, unit normals F x 3 (right-hand winding), areas F
+    tri = vertices[faces]
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    norm = np.linalg.norm(cross, axis=1)
+    normals = cross / np.maximum(norm, 1e-300)[:, None]
+    return tri.mean(axis=1), normals, norm / 2
+
+class CoverageIndex:
+    def __init__(self, frame_ids, areas, offsets, frames, angles, distances):
+        self.frame_ids = np.asarray(frame_ids)
+        self.areas = areas         # F face areas
+        self.offsets = offsets     # F + 1
+        self.frames = frames       # row in frame_ids of each observation
+        self.angles = angles       # viewing angle in degrees, 0 is head-on
+        self.distances = distances # camera center to face centroid
+
+    @classmethod
+    def from_visibility(cls, frame_ids, visible, cam_centers, centroids, normals, areas):
+        # visible: N x F visibility of the face centroids (projection_helpers.project_trajectory)
+        # cam_centers: N x 3 camera positions in world coordinates
+        face_idx, frame_idx = np.nonzero(visible.T) # sorted by face
+        view = cam_centers[frame_idx] - centroids[face_idx]
+        distances = np.linalg.norm(view, axis=1)
+        # faces are two-sided: the camera looks at the inner surface of the bladder models
+        cos = np.abs(np.einsum('ij,ij->i', view, normals[face_idx])) / np.maximum(distances, 1e-300)
+        angles = np.degrees(np.arccos(np.clip(cos, 0, 1)))
+        offsets = np.zeros(len(areas) + 1, np.int64)
+        np.cumsum(np.bincount(face_idx, minlength=len(areas)), out=offsets[1:])
+        return cls(frame_ids, areas, offsets, frame_idx.astype(np.int32), angles.astype(np.float32), \
+                   distances.astype(np.float32))
+
+    def get_face_observations(self, face):
+        rows = slice(self.offsets[face], self.offsets[face + 1])
+        return self.frame_ids[self.frames[rows]], self.angles[rows], self.distances[rows]
+
+    def get_valid(self, max_angle=90, max_distance=np.inf):
+        # observations usable for reconstruction
+        return (self.angles <= max_angle) & (self.distances <= max_distance)
+
+    def get_face_frame_matrix(self, max_angle=90, max_distance=np.inf):
+        # N x F bool, frame row k sees face f under the given limits
+        valid = self.get_valid(max_angle, max_distance)
+        face_idx = np.repeat(np.arange(len(self.areas)), np.diff(self.offsets))
+        seen = np.zeros((len(self.frame_ids), len(self.areas)), bool)
+        seen[self.frames[valid], face_idx[valid]] = True
+        return seen
+
+    def get_view_counts(self, max_angle=90, max_distance=np.inf):
+        face_idx = np.repeat(np.arange(len(self.areas)), np.diff(self.offsets))
+        return np.bincount(face_idx[self.get_valid(max_angle, max_distance)], minlength=len(self.areas))
+
+    def get_coverage(self, frame_rows=None, max_angle=90, max_distance=np.inf, min_views=1):
+        # area fraction of the surface seen in at least min_views of the frames (rows of frame_ids, default all)
+        seen = self.get_face_frame_matrix(max_angle, max_distance)
+        if frame_rows is not None:
+            seen = seen[frame_rows]
+        covered = seen.sum(axis=0) >= min_views
+        return float(self.areas[covered].sum() / self.areas.sum())
+
+    def select_frames(self, target=0.95, max_angle=90, max_distance=np.inf):
+        # Greedy set cover: repeatedly add the frame that sees the largest not yet covered area until
+        # target coverage (fraction of the area coverable by all frames) is reached.
+        # Returns the selected frame ids in order of selection and the coverage after each one.
+        seen = self.get_face_frame_matrix(max_angle, max_distance)
+        coverable = self.areas[seen.any(axis=0)].sum()
+        uncovered = np.ones(len(self.areas), bool)
+        gain_area = seen.astype(np.float64) @ self.areas
+        selected, coverage = [], []
+        covered_area = 0.0
+        while covered_area < target * coverable:
+            k = int(np.argmax(gain_area))
+            if gain_area[k] <= 0:
+                break
+            new = seen[k] & uncovered
+            uncovered &= ~new
+            covered_area += self.areas[new].sum()
+            gain_area -= seen[:, new].astype(np.float64) @ self.areas[new]
+            selected.append(k)
+            coverage.append(covered_area / self.areas.sum())
+        return self.frame_ids[selected], np.array(coverage)
+
+    def save(self, filepath):
+        np.savez(filepath, frame_ids=self.frame_ids, areas=self.areas, offsets=self.offsets, frames=self.frames, \
+                 angles=self.angles, distances=self.distances)
+
+    @classmethod
+    def load(cls, filepath):
+        data = np.load(filepath)
+        return cls(data['frame_ids'], data['areas'], data['offsets'], data['frames'], data['angles'], data['distances'])
+
+# ----------------------------------------------------------
+def build_coverage_index(K, RT, cam_centers, vertices, faces, width, height, frame_ids=None, **kwargs):
+    # kwargs: options of project_trajectory (zbuffer_scale, depth_tol, ...)
+    centroids, normals, areas = get_face_geometry(vertices, faces)
+    vis = project_trajectory(K, RT, centroids, width, height, occluder=(vertices, faces), **kwargs)
+    if frame_ids is None:
+        frame_ids = np.arange(len(cam_centers))
+    return CoverageIndex.from_visibility(frame_ids, vis['visible'], cam_centers, centroids, normals, areas)
+
+def get_coverage_report(index, target=0.95, max_angle=75, max_distance=np.inf):
+    # selected_frames sorted, to be passed as frame_ids; selection_order and selected_coverage in greedy order
+    frames, coverage = index.select_frames(target, max_angle, max_distance)
+    view_counts = index.get_view_counts(max_angle, max_distance)
+    return {'frame_num': len(index.frame_ids), 'coverage': index.get_coverage(max_angle=max_angle, max_distance=max_distance), \
+            'coverage_2views': index.get_coverage(max_angle=max_angle, max_distance=max_distance, min_views=2), \
+            'mean_views': float(np.average(view_counts, weights=index.areas)), \
+            'max_angle': max_angle, 'max_distance': max_distance if np.isfinite(max_distance) else None, \
+            'target': target, 'selected_frames': sorted(int(_) for _ in frames), \
+            'selection_order': [int(_) for _ in frames], 'selected_coverage': [float(_) for _ in coverage]}
+
+def save_coverage_report(filepath, report):
+    file = open(filepath, "w")
+    json.dump(report, file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
@@ -0,0 +1,81 @@
+import os
+import json
+import numpy as np
+
+# Ground truth surface of deforming models, pure numpy: the evaluated (world space) vertex
+# positions for every distinct value of the deformation shape key in a run. The sawtooth
+# of set_helpers.get_deform_value repeats deform_cycle times, so each shape is stored once
+# and frames point to it. Cache folder layout:
+#   values.npy       D float64, distinct shape key values
+#   vertices.npy     D x V x 3 float32 (memory-mapped), world coordinates of each shape
+#   faces.npy        F x 3 int32 triangles
+#   frame_ids.npy    N int64, frame_index.npy N int32 (row in values of each frame)
+#   meta.json        run parameters, 'complete' once every shape is written
+
+def get_distinct_values(values, decimals=9):
+    # distinct values (sorted) and the index of each value in them; values equal up to
+    # decimals (float noise of the sawtooth) share one shape
+    keys = np.round(np.asarray(values, dtype=np.float64), decimals)
+    distinct, index = np.unique(keys, return_inverse=True)
+    return distinct, index.astype(np.int32)
+
+class DeformCache:
+    def __init__(self, cache_dir, mode='r'):
+        self.cache_dir = cache_dir
+        file = open(cache_dir + '/meta.json', "r")
+        self.meta = json.load(file)
+        file.close()
+        self.values = np.load(cache_dir + '/values.npy')
+        self.faces = np.load(cache_dir + '/faces.npy')
+        self.frame_ids = np.load(cache_dir + '/frame_ids.npy')
+        self.frame_index = np.load(cache_dir + '/frame_index.npy')
+        self.vertices = np.load(cache_dir + '/vertices.npy', mmap_mode=mode)
+        self.frame_rows = {int(frame_id): k for k, frame_id in enumerate(self.frame_ids)}
+
+    @classmethod
+    def create(cls, cache_dir, frame_ids, frame_values, vertex_num, faces, meta=None):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        values, frame_index = get_distinct_values(frame_values)
+        np.save(cache_dir + '/values.npy', values)
+        np.save(cache_dir + '/faces.npy', np.asarray(faces, dtype=np.int32))
+        np.save(cache_dir + '/frame_ids.npy', np.asarray(frame_ids, dtype=np.int64))
+        np.save(cache_dir + '/frame_index.npy', frame_index)
+        vertices = np.lib.format.open_memmap(cache_dir + '/vertices.npy', mode='w+', dtype=np.float32, \
+                                             shape=(len(values), vertex_num, 3))
+        del vertices
+        cls.save_meta(cache_dir, dict(meta or {}, complete=False))
+        return cls(cache_dir, 'r+')
+
+    @staticmethod
+    def save_meta(cache_dir, meta):
+        file = open(cache_dir + '/meta.json', "w")
+        json.dump(meta, file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+
+    def set_shape(self, k, vertices):
+        self.vertices[k] = vertices
+
+    def finish(self):
+        self.vertices.flush()
+        self.meta['complete'] = True
+        self.save_meta(self.cache_dir, self.meta)
+
+    def get_shape(self, k):
+        return self.vertices[k]
+
+    def get_frame_vertices(self, frame_id):
+        # V x 3 surface seen in a frame (view of the memory-mapped array)
+        return self.vertices[self.frame_index[self.frame_rows[int(frame_id)]]]
+
+    def get_frame_value(self, frame_id):
+        return float(self.values[self.frame_index[self.frame_rows[int(frame_id)]]])
+
+def is_deform_cache_valid(cache_dir, meta):
+    # complete cache of a run with the same parameters
+    if not os.path.exists(cache_dir + '/meta.json'):
+        return False
+    file = open(cache_dir + '/meta.json', "r")
+    cached = json.load(file)
+    file.close()
+    return cached.pop('complete', False) and cached == meta
@@ -0,0 +1,147 @@
+import os
+import glob
+import numpy as np
+from multiprocessing import Pool
+from image_helpers import read_image, write_image
+from sink_helpers import linear_to_srgb8
+
+# Offline lens distortion of rendered frames, pure numpy: the remap of the compositor
+# Lens Distortion node (ScreenLensDistortionOperation of Blender 2.83, distortion input
+# only: dispersion 0, no jitter) as a lookup table of source pixels and bilinear weights
+# per distortion value and frame size, applied to whole batches of frames. Frames rendered
+# with lens_distortion=0 once give any number of distorted datasets, e.g.
+#   distort_frames_dir('/data/run/base_data/raw_cysto', '/data/run_dis{}/base_data/raw_cysto', [0.1, 0.2])
+
+# ----------------------------------------------------------
+def get_distort_scale(distortion, fit=False):
+    k = min(max(distortion, -0.999), 1.0)
+    return 1.0 / (1.0 + 2.0*k) if fit and k > 0 else 1.0 / (1.0 + k)
+
+def get_distort_map(width, height, distortion, fit=False):
+    # source pixel coordinates (H x W map_x, map_y, pixel centers at integers, top row first) of every
+    # output pixel, and the mask of output pixels with a source (black elsewhere). Computed like the
+    # compositor, in float32 and bottom-up rows, so that pixels exactly on the frame border match.
+    f32 = np.float32
+    k4 = f32(4.0) * f32(min(max(distortion, -0.999), 1.0))
+    sc = f32(get_distort_scale(distortion, fit))
+    cx, cy = f32(0.5 * width), f32(0.5 * height)
+    u = sc * ((np.arange(width, dtype=f32) + f32(0.5)) - cx) / cx
+    v = sc * ((np.arange(height, dtype=f32) + f32(0.5)) - cy) / cy
+    u, v = np.meshgrid(u, v)
+    t = f32(1.0) - k4 * (u*u + v*v)
+    valid = t >= 0
+    d = f32(1.0) / (f32(1.0) + np.sqrt(np.maximum(t, f32(0))))
+    map_x = (u * d + f32(0.5)) * f32(width) - f32(0.5)
+    map_y = (v * d + f32(0.5)) * f32(height) - f32(0.5)
+    # the compositor's bilinear read returns black for samples outside the frame
+    valid &= (map_x >= 0) & (map_x < width) & (map_y >= 0) & (map_y < height)
+    map_x, map_y = map_x.astype(np.float64)[::-1], (height - 1) - map_y.astype(np.float64)[::-1]
+    return map_x, map_y, valid[::-1]
+
+class RemapTable:
+    # flat indices of the 4 source pixels and their bilinear weights for every output pixel;
+    # neighbors outside the frame get weight 0, invalid output pixels all 0
+    # src_shape: (height, width) of the source frames, default the size of the maps
+    def __init__(self, map_x, map_y, valid, src_shape=None):
+        self.shape = map_x.shape
+        self.src_shape = tuple(src_shape) if src_shape is not None else self.shape
+        height, width = self.src_shape
+        x0, y0 = np.floor(map_x), np.floor(map_y)
+        a, b = (map_x - x0).ravel(), (map_y - y0).ravel()
+        x0, y0 = x0.astype(np.int64).ravel(), y0.astype(np.int64).ravel()
+        idx, weights = [], []
+        for dx, dy, w in [(0, 0, (1 - a)*(1 - b)), (1, 0, a*(1 - b)), (0, 1, (1 - a)*b), (1, 1, a*b)]:
+            x, y = x0 + dx, y0 + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height) & valid.ravel()
+            idx.append(np.where(inside, np.clip(y, 0, height - 1)*width + np.clip(x, 0, width - 1), 0))
+            weights.append(np.where(inside, w, 0))
+        self.idx = np.stack(idx).astype(np.int32)           # 4 x H*W
+        self.weights = np.stack(weights).astype(np.float32) # 4 x H*W
+        self.valid = valid
+
+    def apply(self, frames):
+        # frames: H x W x C or N x H x W x C float -> float32, frames of the size of the maps
+        frames = np.asarray(frames)
+        single = frames.ndim == 3
+        if single:
+            frames = frames[None]
+        n, height, width, channels = frames.shape
+        if (height, width) != self.src_shape:
+            raise ValueError('Remap table is for ' + str(self.src_shape) + ' frames, frames are ' + str((height, width)))
+        flat = frames.reshape(n, height*width, channels).astype(np.float32, copy=False)
+        out = np.zeros((n, self.idx.shape[1], channels), np.float32)
+        for idx, w in zip(self.idx, self.weights):
+            out += np.take(flat, idx, axis=1) * w[None, :, None]
+        out = out.reshape((n,) + self.shape + (channels,))
+        return out[0] if single else out
+
+_remap_tables = {}
+
+def get_remap_table(width, height, distortion, fit=False):
+    # cached per (size, distortion, fit), the table is the expensive part
+    key = (width, height, round(float(distortion), 6), bool(fit))
+    if key not in _remap_tables:
+        _remap_tables[key] = RemapTable(*get_distort_map(width, height, distortion, fit))
+    return _remap_tables[key]
+
+# ----------------------------------------------------------
+SRGB8_TO_LINEAR = np.where(np.arange(256)/255 <= 0.04045, np.arange(256)/255/12.92, \
+                           ((np.arange(256)/255 + 0.055)/1.055)**2.4).astype(np.float32)
+
+def distort_frames(frames, distortion, fit=False):
+    # frames: H x W x C (or N x H x W x C) uint8 sRGB, interpolated in linear color as in the
+    # compositor, or float scene linear. Returns the same dtype.
+    frames = np.asarray(frames)
+    height, width = frames.shape[-3:-1]
+    table = get_remap_table(width, height, distortion, fit)
+    if frames.dtype == np.uint8:
+        channels = frames.shape[-1]
+        return linear_to_srgb8(table.apply(SRGB8_TO_LINEAR[frames]), channels)
+    return table.apply(frames)
+
+# ----------------------------------------------------------
+def get_distort_folder(dst_fmt, distortion):
+    # dst_fmt: folder name with {} for the distortion value, e.g. '/data/run_dis{}/base_data/raw_cysto'
+    return dst_fmt.format(format(distortion, 'g'))
+
+def _distort_frame_file(args):
+    src_fp, dst_fmt, distortions, fit, quality = args
+    img = read_image(src_fp)
+    for distortion in distortions:
+        write_image(os.path.join(get_distort_folder(dst_fmt, distortion), os.path.basename(src_fp)), \
+                    distort_frames(img, distortion, fit), quality)
+    return src_fp
+
+def distort_frames_dir(src_dir, dst_fmt, distortions, fit=False, ext='.jpg', process_num=None, quality=95):
+    # all frames of src_dir (rendered with lens_distortion=0), each read once and written once per
+    # distortion value; frames are spread over a pool of processes, each with its own remap tables
+    src_fps = sorted(glob.glob(os.path.join(src_dir, '*' + ext)))
+    for distortion in distortions:
+        folder = get_distort_folder(dst_fmt, distortion)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+    jobs = [(src_fp, dst_fmt, list(distortions), fit, quality) for src_fp in src_fps]
+    if process_num == 1:
+        for job in jobs:
+            _distort_frame_file(job)
+    else:
+        pool = Pool(process_num)
+        for _ in pool.imap_unordered(_distort_frame_file, jobs, chunksize=4):
+            pass
+        pool.close()
+        pool.join()
+    return len(src_fps)
+
+if __name__ == "__main__":
+    # python distort_helpers.py /data/run/base_data/raw_cysto '/data/run_dis{}/base_data/raw_cysto' 0.1 0.2 0.3
+    import argparse
+    parser = argparse.ArgumentParser(description='Apply compositor lens distortion to rendered frames.')
+    parser.add_argument('src_dir', help='frames rendered with lens_distortion=0')
+    parser.add_argument('dst_fmt', help='output folder, {} is replaced by the distortion value')
+    parser.add_argument('distortions', type=float, nargs='+')
+    parser.add_argument('--fit', action='store_true', help='Fit option of the Lens Distortion node')
+    parser.add_argument('--ext', default='.jpg')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    frame_num = distort_frames_dir(args.src_dir, args.dst_fmt, args.distortions, args.fit, args.ext, args.processes)
+    print(str(frame_num) + ' frames x ' + str(len(args.distortions)) + ' distortion values written')
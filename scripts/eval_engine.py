@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+from multiprocessing import Pool
+from recon_io import find_cams_files, read_cams_files, read_tum
+from metrics_helpers import evaluate_models, get_pe_means
+from mv_eval import RECON_FILES, TOLERANCES, get_gt_surface, evaluate_reconstructions, get_summary_row
+
+# Batch evaluation of the experiments of experiment_summary.csv (one row per experiment
+# folder, see all_eval.ipynb): recon_results.json is read and the largest reconstructed
+# trajectory is scored against the gt (metrics_helpers.py, same values as evo).
+# Experiments are spread over a pool of processes and results are cached in
+# <csv stem>_cache.json, keyed on the inputs of each experiment (mtime and size, or
+# content hash), so only new or changed experiments are evaluated again, e.g.
+#   python eval_engine.py /data/experiment_summary.csv --out /data/experiment_summary_updated.csv
+
+EVAL_VERSION = 2 # bump when the metrics change, invalidates every cached result
+RECON_RESULTS = '/base_experiment/recon_results.json'
+SFM_RESULTS = '/base_experiment/sfm/results'
+GT_TRAJ = '/base_data/cam_wmat_tq_gt.txt'
+
+# ----------------------------------------------------------
+def get_input_files(ex_dir, mlp_fp=None):
+    # files the results of an experiment depend on, with the reconstructed surfaces if they are evaluated
+    filepaths = [ex_dir + RECON_RESULTS, ex_dir + GT_TRAJ] + list(find_cams_files(ex_dir + SFM_RESULTS).values())
+    if mlp_fp is not None:
+        filepaths += [ex_dir + filepath for filepath in RECON_FILES.values()]
+    return filepaths
+
+def get_file_key(filepath, key='mtime'):
+    # key: 'mtime' (mtime and size, no read) or 'hash' (sha1 of the content, robust to copies/touch)
+    if not os.path.exists(filepath):
+        return None
+    if key == 'mtime':
+        stat = os.stat(filepath)
+        return [stat.st_mtime_ns, stat.st_size]
+    sha1 = hashlib.sha1()
+    file = open(filepath, "rb")
+    for chunk in iter(lambda: file.read(1 << 20), b''):
+        sha1.update(chunk)
+    file.close()
+    return sha1.hexdigest()
+
+def get_experiment_key(ex_dir, key='mtime', mlp_fp=None, tolerances=TOLERANCES):
+    ex_key = {'version': EVAL_VERSION, 'files': {os.path.relpath(filepath, ex_dir): get_file_key(filepath, key) \
+                                                 for filepath in get_input_files(ex_dir, mlp_fp)}}
+    if mlp_fp is not None:
+        ex_key['mlp'] = [os.path.abspath(mlp_fp), get_file_key(mlp_fp, key), list(tolerances)]
+    return ex_key
+
+# ----------------------------------------------------------
+def get_pe_analysis(ex_dir, ind_largest):
+    # ape/rpe means of the full transformation, translation and rotation of the largest model (Sim(3) aligned)
+    # and the association of all sub-models with the gt (registered/dropped frames, see sync_helpers.py)
+    results = evaluate_models(read_tum(ex_dir + GT_TRAJ), read_cams_files(ex_dir + SFM_RESULTS), deltas=(1,))
+    return get_pe_means(results['models'][ind_largest]), results['association']
+
+def evaluate_experiment(ex_dir, mlp_fp=None, tolerances=TOLERANCES):
+    # {column: value} of one row of the summary, formatted like all_eval.ipynb; mlp_fp: gt surface
+    # to score the reconstructed surfaces against (see mv_eval.py), None to skip them
+    file = open(ex_dir + RECON_RESULTS, "r")
+    recon_result = json.load(file)
+    file.close()
+    ind_largest = recon_result["l2_reprojection_error_all"].index(recon_result["l2_reprojection_error_largest"])
+    row = {'cysto_len': str(round(float(recon_result["cysto_len"]), 1)), \
+           'features': str(round(float(recon_result["features_avg"]))), \
+           'fraction': str(round(float(recon_result["fraction_images_reconstructed_largest"]), 2)), \
+           'L2_reproj_err': str(round(float(recon_result["l2_reprojection_error_largest"]), 2)), \
+           'ind_largest': str(ind_largest), \
+           'mesh_vertices': str(round(float(recon_result["mesh_vertices"]))), \
+           'mesh_faces': str(round(float(recon_result["mesh_faces"]))), \
+           'tex_faces': str(round(float(recon_result["tex_faces"]))), \
+           'tex_faces_pct': str(round(float(recon_result["pct_textured_faces"]), 2)), \
+           'n_sfm_views': str(round(float(recon_result["n_sfm_images"]))), \
+           'n_tex_views': str(round(float(recon_result["n_tex_images"])))}
+    pe_means, association = get_pe_analysis(ex_dir, ind_largest)
+    for name, value in zip(['ape_RT', 'rpe_RT', 'ape_T', 'rpe_T', 'ape_R', 'rpe_R'], pe_means):
+        row[name] = str(round(value, 5))
+    row['n_dropped'] = str(association['dropped'])
+    row['n_segments'] = str(association['segment_num'])
+    if mlp_fp is not None:
+        row.update(get_summary_row(evaluate_reconstructions(ex_dir, get_gt_surface(mlp_fp, min(tolerances) / 4), tolerances)))
+    return row
+
+def _evaluate_job(args):
+    # errors are returned instead of raised, one broken experiment doesn't stop the batch
+    ex_dir, mlp_fp, tolerances = args
+    try:
+        return ex_dir, evaluate_experiment(ex_dir, mlp_fp, tolerances), None
+    except Exception as e:
+        return ex_dir, None, type(e).__name__ + ': ' + str(e)
+
+# ----------------------------------------------------------
+def get_cache_filepath(csv_fp):
+    return os.path.splitext(csv_fp)[0] + '_cache.json'
+
+def load_cache(cache_fp):
+    if not os.path.exists(cache_fp):
+        return {}
+    file = open(cache_fp, "r")
+    cache = json.load(file)
+    file.close()
+    return cache
+
+def save_cache(cache_fp, cache):
+    # temp file first, an interrupted batch keeps the results it already has
+    file = open(cache_fp + '.tmp', "w")
+    json.dump(cache, file, sort_keys=True, indent=1, separators=(',', ': '))
+    file.close()
+    os.replace(cache_fp + '.tmp', cache_fp)
+
+def evaluate_summary(csv_fp, out_fp=None, process_num=None, key='mtime', force=False, cache_fp=None, \
+                     mlp_fp=None, tolerances=TOLERANCES):
+    # updates the rows of csv_fp (written to out_fp, default csv_fp) whose inputs changed since they were
+    # cached, returns the summary DataFrame; force: evaluate every experiment again; mlp_fp: gt surface
+    # (templates/sgt.mlp) to also score the reconstructed surfaces, loaded once per process
+    import pandas as pd
+    cache_fp = cache_fp or get_cache_filepath(csv_fp)
+    summ = pd.read_csv(csv_fp, header=0, index_col=0, sep=',', keep_default_na=False, dtype=str) # values are written back as strings
+    cache = load_cache(cache_fp)
+    ex_keys, jobs = {}, []
+    for ex_dir in summ.index:
+        if not isinstance(ex_dir, str) or ex_dir == '':
+            continue # empty line
+        if not os.path.exists(ex_dir):
+            print('Experiment folder ' + ex_dir + ' does not exist, skipped')
+            continue
+        ex_keys[ex_dir] = get_experiment_key(ex_dir, key, mlp_fp, tolerances)
+        cached = cache.get(ex_dir)
+        if force or cached is None or cached['key'] != ex_keys[ex_dir]:
+            jobs.append(ex_dir)
+    print(str(len(jobs)) + ' of ' + str(len(ex_keys)) + ' experiments to evaluate')
+
+    if jobs:
+        if process_num == 1 or len(jobs) == 1:
+            results = map(_evaluate_job, [(ex_dir, mlp_fp, tolerances) for ex_dir in jobs])
+            pool = None
+        else:
+            pool = Pool(process_num)
+            results = pool.imap_unordered(_evaluate_job, [(ex_dir, mlp_fp, tolerances) for ex_dir in jobs])
+        for ex_dir, row, error in results:
+            if error is not None:
+                print(ex_dir + ' failed: ' + error)
+                continue
+            cache[ex_dir] = {'key': ex_keys[ex_dir], 'row': row}
+            save_cache(cache_fp, cache)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # every cached row goes into the summary, new columns are added
+    for ex_dir in ex_keys:
+        if ex_dir in cache:
+            for col, value in cache[ex_dir]['row'].items():
+                if col not in summ.columns:
+                    summ[col] = ''
+                summ.loc[ex_dir, col] = value
+    summ.to_csv(out_fp or csv_fp)
+    return summ
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Evaluate the experiments of a summary csv file.')
+    parser.add_argument('csv_fp')
+    parser.add_argument('--out', default=None, help='updated csv file, default overwrites csv_fp')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--key', choices=['mtime', 'hash'], default='mtime')
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--mlp', default=None, help='gt surface, e.g. templates/sgt.mlp, to score the reconstructed surfaces')
+    parser.add_argument('--tolerances', type=float, nargs='+', default=TOLERANCES)
+    args = parser.parse_args()
+    evaluate_summary(args.csv_fp, args.out, args.processes, args.key, args.force, mlp_fp=args.mlp, tolerances=args.tolerances)
@@ -0,0 +1,126 @@
+import numpy as np
+
+# Camera geometry on stacks of poses, pure numpy (no Blender/mathutils needed), e.g. for
+# evaluation code. Batch counterparts of the single-matrix functions in get_helpers.py:
+#   N x 4 x 4 world matrices <-> N x 7 TUM rows (tx ty tz qx qy qz qw)
+#   Blender camera world matrices <-> computer vision (OpenCV) extrinsics
+# Quaternions are (x, y, z, w) like in TUM files, with w >= 0.
+
+# bcam stands for blender camera, see get_helpers.get_3x4_RT_matrix_from_blender
+R_BCAM2CV = np.diag([1.0, -1.0, -1.0])
+
+# ----------------------------------------------------------
+def quat_from_rotmat(R):
+    # N x 3 x 3 rotation matrices -> N x 4 quaternions (x, y, z, w)
+    R = np.asarray(R, dtype=np.float64).reshape(-1, 3, 3)
+    m00, m01, m02 = R[:, 0, 0], R[:, 0, 1], R[:, 0, 2]
+    m10, m11, m12 = R[:, 1, 0], R[:, 1, 1], R[:, 1, 2]
+    m20, m21, m22 = R[:, 2, 0], R[:, 2, 1], R[:, 2, 2]
+    # Shepperd's method: pick the largest of w, x, y, z to divide by
+    diag = np.stack([m00 + m11 + m22, m00 - m11 - m22, -m00 + m11 - m22, -m00 - m11 + m22], axis=1)
+    case = np.argmax(diag, axis=1)
+    s = 2.0 * np.sqrt(np.maximum(1.0 + diag[np.arange(len(R)), case], 1e-300))
+    q = np.empty((len(R), 4))
+    candidates = [
+        (s/4, (m21 - m12)/s, (m02 - m20)/s, (m10 - m01)/s), # w
+        ((m21 - m12)/s, s/4, (m01 + m10)/s, (m02 + m20)/s), # x
+        ((m02 - m20)/s, (m01 + m10)/s, s/4, (m12 + m21)/s), # y
+        ((m10 - m01)/s, (m02 + m20)/s, (m12 + m21)/s, s/4), # z
+    ]
+    for k, (w, x, y, z) in enumerate(candidates):
+        sel = case == k
+        q[sel] = np.stack([x[sel], y[sel], z[sel], w[sel]], axis=1)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    q[q[:, 3] < 0] *= -1
+    return q
+
+def rotmat_from_quat(q):
+    # N x 4 quaternions (x, y, z, w) -> N x 3 x 3 rotation matrices
+    q = np.asarray(q, dtype=np.float64).reshape(-1, 4)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = np.empty((len(q), 3, 3))
+    R[:, 0, 0] = 1 - 2*(y*y + z*z)
+    R[:, 0, 1] = 2*(x*y - z*w)
+    R[:, 0, 2] = 2*(x*z + y*w)
+    R[:, 1, 0] = 2*(x*y + z*w)
+    R[:, 1, 1] = 1 - 2*(x*x + z*z)
+    R[:, 1, 2] = 2*(y*z - x*w)
+    R[:, 2, 0] = 2*(x*z - y*w)
+    R[:, 2, 1] = 2*(y*z + x*w)
+    R[:, 2, 2] = 1 - 2*(x*x + y*y)
+    return R
+
+def decompose_matrices(M):
+    # N x 4 x 4 -> translation N x 3, rotation N x 3 x 3, scale N x 3 (as mathutils Matrix.decompose)
+    M = np.asarray(M, dtype=np.float64).reshape(-1, 4, 4)
+    t = M[:, :3, 3].copy()
+    scale = np.linalg.norm(M[:, :3, :3], axis=1)
+    scale[np.linalg.det(M[:, :3, :3]) < 0] *= -1
+    R = M[:, :3, :3] / scale[:, None, :]
+    return t, R, scale
+
+def compose_matrices(t, R):
+    t = np.asarray(t, dtype=np.float64).reshape(-1, 3)
+    M = np.tile(np.eye(4), (len(t), 1, 1))
+    M[:, :3, :3] = R
+    M[:, :3, 3] = t
+    return M
+
+# ----------------------------------------------------------
+def tq_from_matrices(M):
+    # N x 4 x 4 -> N x 7 (tx ty tz qx qy qz qw), batch get_helpers.get_tq_from_matrix
+    t, R, _ = decompose_matrices(M)
+    return np.hstack([t, quat_from_rotmat(R)])
+
+def matrices_from_tq(tq):
+    tq = np.asarray(tq, dtype=np.float64).reshape(-1, 7)
+    return compose_matrices(tq[:, :3], rotmat_from_quat(tq[:, 3:]))
+
+def tum_from_matrices(frame_ids, M):
+    # N x 8 rows of a TUM trajectory file (frame index as timestamp)
+    return np.hstack([np.asarray(frame_ids, dtype=np.float64).reshape(-1, 1), tq_from_matrices(M)])
+
+def matrices_from_tum(tum):
+    tum = np.asarray(tum, dtype=np.float64).reshape(-1, 8)
+    return tum[:, 0], matrices_from_tq(tum[:, 1:])
+
+# ----------------------------------------------------------
+def RT_from_world_matrices(M):
+    # Blender camera world matrices -> N x 4 x 4 world to cv camera transforms,
+    # batch get_helpers.get_3x4_RT_matrix_from_blender
+    t, R, _ = decompose_matrices(M)
+    R_world2bcam = np.transpose(R, (0, 2, 1))
+    T_world2bcam = -np.einsum('nij,nj->ni', R_world2bcam, t)
+    return compose_matrices(T_world2bcam @ R_BCAM2CV.T, R_BCAM2CV @ R_world2bcam)
+
+def RcC_from_RT(RT):
+    # N x 3(4) x 4 world to cv camera transforms -> N x 4 x 4 camera poses (rotation Rc, center C)
+    # in world coordinates with Blender camera axes, batch get_RcC_from_RT of the notebooks
+    RT = np.asarray(RT, dtype=np.float64)
+    if RT.ndim == 2:
+        RT = RT[None]
+    R = R_BCAM2CV @ RT[:, :3, :3] # direction of world axes in blender cam frame
+    t = RT[:, :3, 3] @ R_BCAM2CV.T # pos of world origin in blender cam frame
+    Rc = np.transpose(R, (0, 2, 1))
+    C = -np.einsum('nij,nj->ni', Rc, t)
+    return compose_matrices(C, Rc)
+
+# ----------------------------------------------------------
+# BKE_camera_sensor_fit/BKE_camera_sensor_size, see get_helpers.get_calibration_matrix_K_from_blender
+def calibration_matrix_K(lens, sensor_width, sensor_height, sensor_fit, resolution_x, resolution_y, \
+                         resolution_percentage=100, pixel_aspect_x=1, pixel_aspect_y=1, shift_x=0, shift_y=0):
+    scale = resolution_percentage / 100
+    resolution_x_in_px = scale * resolution_x
+    resolution_y_in_px = scale * resolution_y
+    if sensor_fit == 'AUTO':
+        sensor_fit = 'HORIZONTAL' if pixel_aspect_x * resolution_x_in_px >= pixel_aspect_y * resolution_y_in_px else 'VERTICAL'
+    sensor_size_in_mm = sensor_height if sensor_fit == 'VERTICAL' else sensor_width
+    pixel_aspect_ratio = pixel_aspect_y / pixel_aspect_x
+    view_fac_in_px = resolution_x_in_px if sensor_fit == 'HORIZONTAL' else pixel_aspect_ratio * resolution_y_in_px
+    pixel_size_mm_per_px = sensor_size_in_mm / view_fac_in_px
+    s_u = lens / pixel_size_mm_per_px
+    s_v = lens / pixel_size_mm_per_px / pixel_aspect_ratio
+    u_0 = resolution_x_in_px / 2 - shift_x * view_fac_in_px
+    v_0 = resolution_y_in_px / 2 + shift_y * view_fac_in_px / pixel_aspect_ratio
+    return np.array([[s_u, 0, u_0], [0, s_v, v_0], [0, 0, 1]])
@@ -3,6 +3,7 @@ import bpy_extras
 from mathutils import Matrix, Vector
 import numpy as np
 import time
+import hashlib
 #---------------------------------------------------------------
 # 3x4 P matrix from Blender camera
 #---------------------------------------------------------------
@@ -121,6 +122,14 @@ def get_3x4_P_matrix_from_blender(cam):
     RT = get_3x4_RT_matrix_from_blender(cam)
     return K @ RT, K, RT
 
+# Camera pose with all constraints evaluated.
+# Changing e.g. Follow Path.offset_factor from a script only marks the depsgraph dirty,
+# matrix_world is refreshed by a render or, without rendering, by updating the view layer.
+def get_cam_world_matrix(cam, update=True):
+    if update:
+        bpy.context.view_layer.update()
+    return cam.matrix_world.copy()
+
 def get_tq_from_matrix(RT):
     t = RT.decompose()[0]
     q = RT.decompose()[1]
@@ -140,8 +149,45 @@ def project_by_object_utils(cam, point):
             )
     return Vector((co_2d.x * render_size[0], render_size[1] - co_2d.y * render_size[1]))
 
+# ----------------------------------------------------------
+# numpy arrays of Blender data for the batch functions of geom_helpers.py/projection_helpers.py
+def get_render_size():
+    scene = bpy.context.scene
+    render_scale = scene.render.resolution_percentage / 100
+    return int(scene.render.resolution_x * render_scale), int(scene.render.resolution_y * render_scale)
+
+# World space vertices (V x 3) and triangles (F x 3 vertex indices) of a mesh object,
+# with modifiers and the current shape key values applied
+def get_mesh_world_arrays(obj):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    mesh.calc_loop_triangles()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32) # buffer types matching the properties, no per-item copy
+    mesh.vertices.foreach_get('co', co)
+    faces = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', faces)
+    mw = np.array(obj_eval.matrix_world)
+    obj_eval.to_mesh_clear()
+    vertices = co.reshape(-1, 3).astype(np.float64) @ mw[:3, :3].T + mw[:3, 3]
+    return vertices, faces.reshape(-1, 3).astype(np.int64)
+
+# Fingerprint of a curve object's geometry (control points, resolution, world matrix incl. delta_scale),
+# the key of cached per-curve data such as the arc-length tables of traj_helpers.py
+def get_curve_hash(curve):
+    sha = hashlib.sha1(np.array(curve.matrix_world, dtype=np.float64).tobytes())
+    sha.update(np.array([curve.data.resolution_u], dtype=np.int64).tobytes())
+    for spline in curve.data.splines:
+        for points, attrs in [(spline.bezier_points, ['co', 'handle_left', 'handle_right']), (spline.points, ['co'])]:
+            for attr in attrs:
+                co = np.empty(len(points) * len(points[0].co) if len(points) else 0, dtype=np.float32)
+                points.foreach_get(attr, co)
+                sha.update(co.tobytes())
+    return sha.hexdigest()
+
 # ----------------------------------------------------------
 if __name__ == "__main__":
+    from recon_io import get_reconstructed_traj_file
 #    # Debugging:
     a=Matrix((
             (0.999979, 0.00495278, 0.00412434),
@@ -158,13 +204,13 @@ if __name__ == "__main__":
 #    print("matrix_world:\n", mw)
 #    print("det(Rc)=", Matrix((RT4x4[0][0:3], RT4x4[1][0:3],RT4x4[2][0:3])).determinant())
 #    print("det(mw)=", Matrix((mw[0][0:3], mw[1][0:3],mw[2][0:3])).determinant())
-    get_reconstructed_traj_file(source='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SpiInnT10S0p013+NOdef+NOdis/base_experiment/sfm/results/model-0-cams.txt', dest_filepath='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SpiInnT10S0p013+NOdef+NOdis/base_experiment/sfm/results/')
+    get_reconstructed_traj_file(source='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SpiInnT10S0p013+NOdef+NOdis/base_experiment/sfm/results/model-0-cams.txt', dest='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SpiInnT10S0p013+NOdef+NOdis/base_experiment/sfm/results/')
     
-#    get_reconstructed_traj_file(source='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SinInnT10S0p1+NOdef+NOdis/base_experiment/sfm/results/model-0-cams.txt', dest_filepath='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SinInnT10S0p1+NOdef+NOdis/base_experiment/sfm/results/')  # TODO: frame number bug
+#    get_reconstructed_traj_file(source='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SinInnT10S0p1+NOdef+NOdis/base_experiment/sfm/results/model-0-cams.txt', dest='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/evs_20201210_BS+SinInnT10S0p1+NOdef+NOdis/base_experiment/sfm/results/')  # TODO: frame number bug
 
 #    cam = bpy.data.objects['endo_cam']
-#    cam.constraints["Follow Path"].offset_factor = 0.1 # TODO: change offset factor in script doesn't work! only take effect after rendering.
-#    time.sleep(5)
+#    cam.constraints["Follow Path"].offset_factor = 0.1 # takes effect after rendering or bpy.context.view_layer.update(), see get_cam_world_matrix
+#    bpy.context.view_layer.update()
 #    _, RT = get_3x4_RT_matrix_from_blender(cam)
 #    print(cam)
 #    print("m:", cam.matrix_world.decompose())
@@ -173,7 +219,7 @@ if __name__ == "__main__":
 #    print("tq:", tq)
 #    
 #    cam.constraints["Follow Path"].offset_factor = 0.8
-#    time.sleep(5)
+#    bpy.context.view_layer.update()
 #    _, RT = get_3x4_RT_matrix_from_blender(cam)
 #    print(cam)
 #    print("m:", cam.matrix_world.decompose())
@@ -0,0 +1,107 @@
+import os
+import json
+import numpy as np
+from geom_helpers import tum_from_matrices
+
+# Binary ground truth of a run, next to the TUM text trajectory: a folder of memory-mapped
+# .npy arrays with one slot per frame index, filled as the frames render.
+#   frame_ids.npy        N int64, frame index of each slot
+#   done.npy             N uint8, 1 once the slot is written
+#   cam_wmat.npy         N x 4 x 4 float64, camera world matrix (Blender camera axes)
+#   lens_distortion.npy  N float64, distortion of the compositor Lens Distortion node
+#   deform_value.npy     N float64, value of the deformation shape key
+#   K.npy                3 x 3 float64, intrinsics
+#   meta.json            run parameters and render settings
+# Everything is stored at full precision, the TUM file is a derived view (export_tum).
+
+FRAME_ARRAYS = {'frame_ids': ((), np.int64), 'done': ((), np.uint8), 'cam_wmat': ((4, 4), np.float64), \
+                'lens_distortion': ((), np.float64), 'deform_value': ((), np.float64)}
+
+def get_gt_store_dir(traj_file):
+    # store folder of a trajectory file name, e.g. cam_wmat_tq_gt.txt -> cam_wmat_tq_gt.gt
+    return os.path.splitext(traj_file)[0] + '.gt'
+
+class GTStore:
+    def __init__(self, store_dir, mode='r'):
+        # mode: 'r' read only, 'r+' append to an existing store
+        self.store_dir = store_dir
+        file = open(store_dir + '/meta.json', "r")
+        self.meta = json.load(file)
+        file.close()
+        self.K = np.load(store_dir + '/K.npy')
+        self.arrays = {key: np.load(store_dir + '/' + key + '.npy', mmap_mode=mode) for key in FRAME_ARRAYS}
+
+    @classmethod
+    def create(cls, store_dir, frame_num, K, meta=None):
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        for key, (shape, dtype) in FRAME_ARRAYS.items():
+            array = np.lib.format.open_memmap(store_dir + '/' + key + '.npy', mode='w+', dtype=dtype, shape=(frame_num,) + shape)
+            array[:] = np.arange(frame_num) if key == 'frame_ids' else 0
+            array.flush()
+            del array
+        np.save(store_dir + '/K.npy', np.asarray(K, dtype=np.float64))
+        file = open(store_dir + '/meta.json', "w")
+        json.dump(dict(meta or {}, frame_num=frame_num), file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+        return cls(store_dir, 'r+')
+
+    @classmethod
+    def open(cls, store_dir, frame_num, K, meta=None, resume=False):
+        # reuse the store of an interrupted run only if it was written with the same parameters
+        if resume and os.path.exists(store_dir + '/meta.json'):
+            store = cls(store_dir, 'r+')
+            if store.meta == dict(meta or {}, frame_num=frame_num) and np.allclose(store.K, K):
+                return store
+            store.close()
+            print('Run parameters changed, discarding gt store ' + store_dir)
+        return cls.create(store_dir, frame_num, K, meta)
+
+    def __len__(self):
+        return len(self.arrays['frame_ids'])
+
+    def set_frame(self, frame_id, cam_wmat, lens_distortion=0.0, deform_value=0.0):
+        self.arrays['cam_wmat'][frame_id] = np.asarray(cam_wmat, dtype=np.float64)
+        self.arrays['lens_distortion'][frame_id] = lens_distortion
+        self.arrays['deform_value'][frame_id] = deform_value
+        self.arrays['done'][frame_id] = 1 # last, a crash leaves the slot not done
+
+    def is_frame_done(self, frame_id):
+        return bool(self.arrays['done'][frame_id])
+
+    def get_done_ids(self):
+        return np.flatnonzero(self.arrays['done'])
+
+    def get(self, key, frame_ids=None):
+        # in-memory copy of a per-frame array for the given frames (default all done frames)
+        if frame_ids is None:
+            frame_ids = self.get_done_ids()
+        return np.array(self.arrays[key][frame_ids])
+
+    def get_tum(self, frame_ids=None):
+        if frame_ids is None:
+            frame_ids = self.get_done_ids()
+        return tum_from_matrices(frame_ids, self.arrays['cam_wmat'][frame_ids])
+
+    def export_tum(self, filepath, frame_ids=None, fmt='%.5f'):
+        np.savetxt(filepath, self.get_tum(frame_ids), fmt=fmt)
+
+    def flush(self):
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap) and array.mode != 'r':
+                array.flush()
+
+    def close(self):
+        self.flush()
+        self.arrays = {}
+
+def merge_gt_stores(dest_dir, source_dirs):
+    # union of the done frames of stores of the same run, e.g. one per shard
+    sources = [GTStore(source_dir) for source_dir in source_dirs]
+    dest = GTStore.create(dest_dir, len(sources[0]), sources[0].K, sources[0].meta)
+    for source in sources:
+        ids = source.get_done_ids()
+        for key in FRAME_ARRAYS:
+            dest.arrays[key][ids] = source.arrays[key][ids]
+    dest.flush()
+    return dest
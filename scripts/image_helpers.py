@@ -0,0 +1,102 @@
+import os
+import zlib
+import struct
+import numpy as np
+
+# Image encoding/decoding for numpy frames outside of Blender's image API (which is not
+# thread safe). PNG writing and .npy work everywhere, JPEG/EXR and reading images use
+# OpenCV or imageio when one of them is installed.
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    import imageio
+except ImportError:
+    imageio = None
+
+# ----------------------------------------------------------
+def encode_png(img, compress_level=6):
+    # img: HxW, HxWx3 or HxWx4 uint8/uint16; zlib releases the GIL, so this runs in parallel in threads
+    img = np.ascontiguousarray(img)
+    if img.ndim == 2:
+        img = img[..., None]
+    height, width, channels = img.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    bit_depth = 16 if img.dtype == np.uint16 else 8
+    if bit_depth == 16:
+        img = img.astype('>u2')
+    rows = img.reshape(height, -1).view(np.uint8)
+    raw = np.hstack([np.zeros((height, 1), np.uint8), rows]) # filter type 0 per row
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    ihdr = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)) \
+           + chunk(b'IEND', b'')
+
+def encode_image(img, ext, quality=95):
+    # img: uint8 RGB(A) for .png/.jpg, float32 for .exr
+    ext = ext.lower()
+    if ext == '.png':
+        return encode_png(img)
+    if cv2 is not None:
+        bgr = img[..., ::-1] if img.ndim == 3 and img.shape[2] >= 3 else img
+        if img.ndim == 3 and img.shape[2] == 4:
+            bgr = img[..., [2, 1, 0, 3]]
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext in ['.jpg', '.jpeg'] else []
+        try: # EXR raises without OPENCV_IO_ENABLE_OPENEXR
+            ok, data = cv2.imencode(ext, np.ascontiguousarray(bgr), params)
+        except cv2.error:
+            ok = False
+        if ok:
+            return data.tobytes()
+    if imageio is not None:
+        kwargs = {'quality': quality} if ext in ['.jpg', '.jpeg'] else {}
+        return imageio.imwrite('<bytes>', img, format=ext, **kwargs)
+    raise ValueError('No encoder available for ' + ext + ' (install opencv or imageio, or use .png)')
+
+_encoders = {}
+
+def has_encoder(ext):
+    # probed with a 1x1 encode, once per extension: Blender's bundled Python has neither OpenCV
+    # nor imageio, and an installed one may still lack a format (e.g. OpenCV's EXR)
+    ext = ext.lower()
+    if ext in ['.png', '.npy']:
+        return True
+    if ext not in _encoders:
+        try:
+            encode_image(np.zeros((1, 1, 3), np.float32 if ext == '.exr' else np.uint8), ext)
+            _encoders[ext] = True
+        except Exception:
+            _encoders[ext] = False
+    return _encoders[ext]
+
+def check_encoder(ext):
+    if not has_encoder(ext):
+        raise ValueError('No encoder available for ' + ext + ' (install opencv or imageio, or use .png)')
+
+def write_image(img_fp, img, quality=95):
+    ext = os.path.splitext(img_fp)[1]
+    if ext == '.npy':
+        np.save(img_fp, img)
+        return
+    data = encode_image(img, ext, quality)
+    file = open(img_fp, "wb")
+    file.write(data)
+    file.close()
+
+def read_image(img_fp):
+    # HxWxC uint8 RGB(A) (float32 for .exr)
+    ext = os.path.splitext(img_fp)[1].lower()
+    if ext == '.npy':
+        return np.load(img_fp)
+    if cv2 is not None:
+        img = cv2.imread(img_fp, cv2.IMREAD_UNCHANGED)
+        if img is not None:
+            if img.ndim == 3:
+                img = img[..., [2, 1, 0, 3]] if img.shape[2] == 4 else img[..., ::-1]
+            return np.ascontiguousarray(img)
+    if imageio is not None:
+        return np.asarray(imageio.imread(img_fp))
+    raise ValueError('No decoder available for ' + img_fp + ' (install opencv or imageio)')
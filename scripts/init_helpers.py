@@ -5,7 +5,47 @@ from mathutils import Matrix, Vector
 import math
 import os
 
-def init_scene(scene_id='Scene', cam_obj_id='endo_cam', scale=1):
+# Named CPU render profiles, ordered from the lowest to the highest quality.
+# tile_size: CPU renders fastest with small tiles; adaptive_threshold: noise level at which
+# adaptive sampling stops (0 = automatic); threads: render threads, 0 uses all cores
+RENDER_PROFILES = {
+    'draft':     {'device': 'CPU', 'samples': 4,  'max_bounces': 1, 'tile_size': 32, \
+                  'use_adaptive_sampling': True, 'adaptive_threshold': 0.1, 'use_denoising': False, 'threads': 0},
+    'benchmark': {'device': 'CPU', 'samples': 16, 'max_bounces': 1, 'tile_size': 32, \
+                  'use_adaptive_sampling': False, 'adaptive_threshold': 0, 'use_denoising': False, 'threads': 0},
+    'final':     {'device': 'CPU', 'samples': 64, 'max_bounces': 4, 'tile_size': 32, \
+                  'use_adaptive_sampling': True, 'adaptive_threshold': 0.01, 'use_denoising': True, 'threads': 0},
+}
+
+def get_render_profile(profile, **overrides):
+    # profile: name in RENDER_PROFILES or a dict of settings
+    settings = dict(RENDER_PROFILES[profile]) if isinstance(profile, str) else dict(profile)
+    settings.update(overrides)
+    return settings
+
+def set_render_profile(scene, profile, threads=None):
+    # threads: overrides the threads of the profile, 0 uses all cores
+    settings = get_render_profile(profile)
+    settings['threads'] = settings.get('threads', 0) if threads is None else threads
+    threads = settings['threads']
+    scene.cycles.device = settings['device']
+    scene.render.threads_mode = 'AUTO' if threads == 0 else 'FIXED'
+    if threads > 0:
+        scene.render.threads = threads
+    if hasattr(scene.render, 'tile_x'): # tiles are gone in Cycles X (3.0+)
+        scene.render.tile_x = settings['tile_size']
+        scene.render.tile_y = settings['tile_size']
+    scene.cycles.samples = settings['samples']
+    scene.cycles.max_bounces = settings['max_bounces']
+    scene.cycles.use_adaptive_sampling = settings['use_adaptive_sampling']
+    scene.cycles.adaptive_threshold = settings['adaptive_threshold']
+    for view_layer in scene.view_layers:
+        view_layer.cycles.use_denoising = settings['use_denoising']
+    if hasattr(scene.cycles, 'denoiser'): # 2.90+, OpenImageDenoise is the fast one on CPU
+        scene.cycles.denoiser = 'OPENIMAGEDENOISE'
+    return settings
+
+def init_scene(scene_id='Scene', cam_obj_id='endo_cam', scale=1, profile=None):
     assert scene_id in bpy.data.scenes.keys()
     scene = bpy.data.scenes[scene_id]
         
@@ -38,6 +78,10 @@ def init_scene(scene_id='Scene', cam_obj_id='endo_cam', scale=1):
     scene.unit_settings.scale_length = scale  #set unit scale of scene to default 1m
     scene.unit_settings.system_rotation = 'DEGREES'
     scene.unit_settings.length_unit = 'METERS'
+
+    # Override the default (GPU) render settings with a named profile
+    if profile is not None:
+        set_render_profile(scene, profile)
     
 def init_global_delta_transform(): #####
     for obj in bpy.data.objects:
@@ -91,8 +135,8 @@ def init_camera(cam_id):
     cam.lens_unit = 'FOV'
     cam.angle = 120 * math.pi/180 # in Radians
     
-def main():
-    init_scene()
+def main(profile=None):
+    init_scene(profile=profile)
     init_global_delta_transform()
     init_camera(cam_id='Camera'); init_light(light_id='Light', type='POINT');
     init_light(light_id='Point', type='POINT')
@@ -4,11 +4,14 @@ import os
 import shutil
 import importlib
 import json
+import time
 
 dir = os.path.dirname(bpy.data.filepath) + '/scripts'
 if not dir in sys.path:
     sys.path.append(dir)
-import init_helpers, get_helpers, set_helpers
+import init_helpers, get_helpers, set_helpers, manifest_helpers, video_helpers, capture_helpers, sink_helpers, perf_helpers, \
+       geom_helpers, projection_helpers, coverage_helpers, gt_store, traj_helpers, \
+       deform_cache, camera_export, image_helpers
 # this next part forces a reload in case you edit the source after you first start the blender session
 importlib.reload(init_helpers)
 from init_helpers import *
@@ -16,13 +19,79 @@ importlib.reload(get_helpers)
 from get_helpers import *
 importlib.reload(set_helpers)
 from set_helpers import *
+importlib.reload(manifest_helpers)
+from manifest_helpers import *
+importlib.reload(video_helpers)
+from video_helpers import open_video_writer, convert_frames2video, get_input_codec, check_video_input
+importlib.reload(capture_helpers)
+from capture_helpers import RenderCapture, get_srgb8_settings
+importlib.reload(sink_helpers)
+from sink_helpers import AsyncFrameWriter
+importlib.reload(image_helpers)
+from image_helpers import has_encoder
+importlib.reload(perf_helpers)
+from perf_helpers import FrameProfiler, RenderStageTimer, get_datablock_counts, print_profile_summary
+importlib.reload(geom_helpers)
+from geom_helpers import RT_from_world_matrices, matrices_from_tq
+importlib.reload(gt_store)
+from gt_store import GTStore, get_gt_store_dir
+importlib.reload(traj_helpers)
+from traj_helpers import get_arc_length_table, get_arc_length_cache_file, load_arc_length_table, save_arc_length_table, \
+                         get_frame_num_from_step, get_frame_offsets
+importlib.reload(deform_cache)
+from deform_cache import DeformCache, is_deform_cache_valid
+importlib.reload(projection_helpers)
+from projection_helpers import project_trajectory, save_visibility
+importlib.reload(coverage_helpers)
+from coverage_helpers import build_coverage_index, get_coverage_report, save_coverage_report
+importlib.reload(camera_export)
+from camera_export import EXPORT_FORMATS, export_cameras, write_camera_params_json
 
 def scan_and_render(data_folder, frame_fd, frame_num, model_id, traj_id, traj_scale, light_id, render_mode, lens_distortion, \
-                    apply_deform, deform_max, deform_cycle, save_render, save_traj, save_video): 
+                    apply_deform, deform_max, deform_cycle, save_render, save_traj, save_video, \
+                    frame_ids=None, traj_file='cam_wmat_tq_gt.txt', resume=False, manifest_file=None, init=True, \
+                    sinks=None, writer_threads=0, writer_queue=8, render_profile=None, target_spf=None, render_threads=None, \
+                    grid_model_id=None, grid_frame_fd='raw_grid', gt_passes=(), grid_samples=0, \
+                    instrument=False, step_mm=None, frame_offsets=None, save_deform=False, camera_formats=EXPORT_FORMATS, \
+                    template_folder=None, stats_prefix=None): 
+    # frame_ids: subset of frame indices to render (e.g. one shard of a sharded run), default is all frames
+    # traj_file: gt trajectory file name (TUM, exported from the binary gt store <traj_file stem>.gt/), relative to data_folder
+    # resume: skip frames that a previous run with the same parameters already finished
+    # manifest_file: run manifest file name, relative to data_folder, default is <frame_fd>_manifest.json
+    # init: initialize the scene and hide all objects, False if the caller keeps the scene state (see sweep.py)
+    # sinks: frame sinks (see sink_helpers.py) that get each composited render as a numpy array ('RENDER' mode only),
+    #        e.g. with save_render=False to skip image files altogether; closing them is up to the caller
+    # writer_threads: >0 saves frames from a pool of writer threads (queue of writer_queue frames) while
+    #                 the next frame renders, instead of inside the render call ('RENDER' mode only)
+    # camera_formats: with save_traj, gt cameras exported to data_folder/cameras for reconstruction tools
+    #                 (see camera_export.py), () for none
+    # template_folder: folder of camera_params.json, data_config.json, ... templates; the camera json export
+    #                  falls back to default keys and save_video doesn't configure base_data without it
+    # render_profile: name in init_helpers.RENDER_PROFILES or a settings dict, default keeps the settings of init_scene;
+    #                 'AUTO' probes a few frames and picks the highest quality profile within target_spf seconds per frame
+    # render_threads: render threads, overrides those of the profile (0 uses all cores), e.g. per shard
+    # grid_model_id: also write the frames textured like this model (e.g. 'grid_sphere') to grid_frame_fd in the same
+    #                render, it must share model_id's geometry and UV map ('RENDER' mode and save_render only)
+    # gt_passes: also write 'depth' and/or 'normal' passes (EXR, raw_depth/, raw_normal/) of each frame
+    # grid_samples: samples of the grid images, 0 uses the samples of the render profile
+    # instrument: record per-frame timings (pose/shape key update, render, compositor, write, ...), peak RSS and
+    #             datablock counts to <frame_fd>_profile.json/.csv, with a p50/p95 and throughput summary
+    # step_mm: place frames at this constant distance along the trajectory, frame_num (may be None) is derived from the curve length
+    # frame_offsets: offset_factor of each frame index, default i/frame_num (or from step_mm)
+    # save_deform: with apply_deform, store the deformed surface of every frame in deform_cache/ (see deform_cache.py)
+    # stats_prefix: prefix of the writer stats and profile files, relative to data_folder, default <frame_fd>
+    # returns the run parameters of the manifest, with the resolved frame_num and render profile
+    if render_profile == 'AUTO' and target_spf is None:
+        raise ValueError('render_profile AUTO needs a target_spf (seconds per frame)')
     # Initialization
-    init_helpers.main()
-    set_hide_render(bpy.data.objects)
-    set_hide_viewport(bpy.data.objects)
+    if init:
+        init_helpers.main()
+        set_hide_render(bpy.data.objects)
+        set_hide_viewport(bpy.data.objects)
+    if render_profile is not None and render_profile != 'AUTO':
+        render_profile = set_render_profile(bpy.data.scenes['Scene'], render_profile, render_threads)
+    if save_video and save_render:
+        check_video_input(bpy.data.scenes['Scene'].render.file_extension)
 #    cam = bpy.data.scenes['Scene'].camera
     cam = bpy.data.objects['endo_cam']
     K = get_calibration_matrix_K_from_blender(cam.data)
@@ -31,6 +100,10 @@ def scan_and_render(data_folder, frame_fd, frame_num, model_id, traj_id, traj_sc
     # Set cam traj and model, light
     set_cam_trajectory(curve_id=traj_id, delta_scale=traj_scale)
     set_model(obj_id=model_id) # enable model in renderer and set camera track object
+    if step_mm is not None:
+        frame_num, frame_offsets = get_arc_length_frames(cam, traj_id, traj_scale, step_mm)
+    elif frame_num is None:
+        raise ValueError('frame_num is needed without step_mm')
     set_hide_render([bpy.data.objects[light_id], cam], False)
     set_hide_viewport([bpy.data.objects[light_id], cam], False)
     
@@ -48,39 +121,331 @@ def scan_and_render(data_folder, frame_fd, frame_num, model_id, traj_id, traj_sc
     filepath = data_folder + '/' + frame_fd + '/'
     if not os.path.exists(filepath):
         os.makedirs(filepath)
+    scene = bpy.data.scenes['Scene']
+    unset_multi_output(scene)
+    multi_output = save_render and render_mode == 'RENDER' and (grid_model_id is not None or gt_passes)
+    if multi_output:
+        set_multi_output(scene, data_folder, grid_model_id, grid_frame_fd, gt_passes, grid_samples)
+    if render_profile == 'AUTO':
+        autotune_fp = data_folder+'/'+frame_fd+'_autotune.json'
+        autotune = None
+        if resume and os.path.exists(autotune_fp): # keep the profile of the interrupted run
+            file = open(autotune_fp, "r")
+            autotune = json.load(file)
+            file.close()
+        if autotune is None or autotune['target_spf'] != target_spf:
+            render_profile, probes = autotune_render_profile(cam, frame_num, target_spf, frame_offsets=frame_offsets, \
+                                                             threads=render_threads)
+            autotune = {'target_spf': target_spf, 'profile': render_profile, 'probes': probes}
+            file = open(autotune_fp, "w")
+            json.dump(autotune, file, sort_keys=True, indent=4, separators=(',', ': '))
+            file.close()
+        render_profile = set_render_profile(bpy.data.scenes['Scene'], autotune['profile'], render_threads)
         
-    cam_extmat_tq_gt = [] if save_traj else None
-    # Start frames generation
-    for i in range(frame_num):
-        cam.constraints["Follow Path"].offset_factor = i * 1.0/frame_num
-        if not apply_deform:
-            bpy.data.objects[model_id].active_shape_key_index = 0
+    run_params = get_run_params(frame_fd=frame_fd, frame_num=frame_num, model_id=model_id, traj_id=traj_id, \
+                                traj_scale=traj_scale, light_id=light_id, render_mode=render_mode, \
+                                lens_distortion=lens_distortion, apply_deform=apply_deform, \
+                                deform_max=deform_max, deform_cycle=deform_cycle, render_profile=render_profile, \
+                                grid_model_id=grid_model_id, gt_passes=list(gt_passes), step_mm=step_mm)
+    manifest_fp = data_folder + '/' + (manifest_file if manifest_file else frame_fd + '_manifest.json')
+    manifest = open_manifest(manifest_fp, run_params, resume)
+    if save_deform and apply_deform:
+        build_deform_cache(data_folder+'/deform_cache', model_id, frame_num, deform_max, deform_cycle)
+        
+    if frame_ids is None:
+        frame_ids = range(frame_num)
+    # binary gt (full precision poses, K, per-frame distortion/deformation), the TUM file is exported from it
+    gt_store = None
+    if save_traj:
+        gt_store = GTStore.open(data_folder+'/'+get_gt_store_dir(traj_file), frame_num, np.array(K), \
+                                meta={'params': run_params, 'resolution': list(get_render_size())}, resume=resume)
+    # frames are saved by writer threads, from the captured render result; Blender saves them instead when
+    # the format has no encoder here (JPEG/EXR without OpenCV/imageio) or the color management isn't reproducible
+    frame_writer = None
+    if save_render and writer_threads > 0 and render_mode == 'RENDER':
+        ext = scene.render.file_extension
+        color = get_srgb8_settings(scene) if ext not in ['.exr', '.npy'] else {}
+        if not has_encoder(ext):
+            print('Writer threads disabled: no ' + ext + ' encoder (install opencv or imageio), Blender saves the frames')
+        elif color is None:
+            print('Writer threads disabled: view ' + scene.view_settings.view_transform + ' is not reproducible, Blender saves the frames')
         else:
-            bpy.data.objects[model_id].active_shape_key_index = 1
-            bpy.data.objects[model_id].active_shape_key.value = i%int(frame_num/deform_cycle) * 1.0/(frame_num/deform_cycle) * deform_max
-        bpy.data.scenes['Scene'].render.filepath = filepath+'cysto_'+format(i, '06d')
-        if render_mode == 'SNAPSHOT':
-            bpy.ops.render.opengl(animation=False, render_keyed_only=False, sequencer=False, write_still=save_render, view_context=True)
-        elif render_mode == 'RENDER':
-            bpy.ops.render.render(animation=False, write_still=save_render, use_viewport=False)
-        if save_traj:
+            frame_writer = AsyncFrameWriter(filepath+'cysto_{:06d}'+ext, thread_num=writer_threads, queue_size=writer_queue, \
+                                            quality=scene.render.image_settings.quality, **color)
+            sinks = list(sinks or []) + [frame_writer]
+    write_still = save_render and frame_writer is None
+    # video is encoded while rendering, frame by frame (from the written files once the writer threads are done)
+    video_writer = None
+    if save_video and save_render and frame_writer is None:
+        video_writer = open_video_writer(data_folder+'/video_cysto.avi', frame_rate=10, \
+                                         input_codec=get_input_codec(scene.render.file_extension))
+    capture = RenderCapture(bpy.data.scenes['Scene']) if sinks else None
+    profiler = FrameProfiler(enabled=instrument, datablock_counter=get_datablock_counts)
+    stage_timer = RenderStageTimer() if instrument and render_mode == 'RENDER' else None
+    if stage_timer is not None:
+        stage_timer.register()
+    # Start frames generation
+    try:
+        for i in frame_ids:
+            frame_fp = filepath+'cysto_'+format(i, '06d')
+            img_fp = frame_fp + bpy.data.scenes['Scene'].render.file_extension if save_render else None
+            deform_value = get_deform_value(i, frame_num, deform_max, deform_cycle) if apply_deform else 0.0
+            extra_fps = get_multi_output_files(scene, data_folder, i, grid_model_id, grid_frame_fd, gt_passes) if multi_output else []
+            if resume and is_frame_done(manifest, i, img_fp, extra_fps):
+                if save_traj and not gt_store.is_frame_done(i):
+                    gt_store.set_frame(i, matrices_from_tq(get_frame_tq(manifest, i))[0], lens_distortion, deform_value)
+                if video_writer is not None:
+                    video_writer.add_frame_file(img_fp)
+                continue
+            profiler.start_frame(i)
+            with profiler.section('manifest'):
+                set_frame_status(manifest_fp, manifest, i, 'rendering')
+            # when instrumented, the depsgraph is evaluated here so that pose and shape key updates aren't counted as render
+            with profiler.section('pose'):
+                set_cam_offset(cam, get_frame_offset(i, frame_num, frame_offsets))
+                if instrument:
+                    bpy.context.view_layer.update()
+            with profiler.section('shape_key'):
+                set_deform(bpy.data.objects[model_id], apply_deform, deform_value)
+                if instrument:
+                    bpy.context.view_layer.update()
+            bpy.data.scenes['Scene'].render.filepath = frame_fp
+            scene.frame_current = i # frame number in the names of the grid/pass images
+            if render_mode == 'SNAPSHOT':
+                with profiler.section('render_call'):
+                    bpy.ops.render.opengl(animation=False, render_keyed_only=False, sequencer=False, write_still=write_still, view_context=True)
+            elif render_mode == 'RENDER':
+                with profiler.section('render_call'):
+                    bpy.ops.render.render(animation=False, write_still=write_still, use_viewport=False)
+                if stage_timer is not None:
+                    for stage, t in stage_timer.get_stages(time.time()).items():
+                        profiler.add(stage, t)
+                if capture is not None:
+                    with profiler.section('sinks'):
+                        img = capture.grab()
+                        for sink in sinks:
+                            sink.write(i, img)
             _, RT = get_3x4_RT_matrix_from_blender(cam)
 #            tq = get_tq_from_matrix(RT)
             tq = get_tq_from_matrix(cam.matrix_world)
-            tq.insert(0, i)
-#            print(tq)
-            cam_extmat_tq_gt.append(tq)
+            with profiler.section('manifest'):
+                set_frame_status(manifest_fp, manifest, i, 'done', tq)
+            if video_writer is not None:
+                with profiler.section('video'):
+                    video_writer.add_frame_file(img_fp)
+            if save_traj:
+                gt_store.set_frame(i, np.array(cam.matrix_world), lens_distortion, deform_value)
+            profiler.end_frame()
+    finally: # the scene and the sinks are left as they were, also when a frame fails
+        if stage_timer is not None:
+            stage_timer.unregister()
+        unset_multi_output(scene)
+        if video_writer is not None:
+            video_writer.close()
+        if frame_writer is not None:
+            frame_writer.close()
+        if gt_store is not None:
+            gt_store.flush()
+    # exports once every frame is saved and the video finalized
+    if frame_writer is not None:
+        file = open(data_folder+'/'+(stats_prefix or frame_fd)+'_writer_stats.json', "w")
+        json.dump(frame_writer.get_stats(), file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+        if save_video: # from the written files, the JPEG frames are copied as they are
+            convert_frames2video(filepath, 'video_cysto.avi', frame_rate=10, ext=scene.render.file_extension)
+    if instrument:
+        print_profile_summary(profiler.save(data_folder+'/'+(stats_prefix or frame_fd)+'_profile'))
     if save_traj:
-        cam_extmat_tq_gt = np.matrix(cam_extmat_tq_gt)
-        np.savetxt(data_folder+"/cam_wmat_tq_gt.txt", cam_extmat_tq_gt, fmt='%.5f')
-    if save_video:
-        generate_video_from_frames(frame_dir=filepath, vid_name='video_cysto.avi', frame_rate=10)
-        configure_base_data_folder(data_folder, template_folder, cysto_frame_start=0, cysto_frame_end=frame_num)
+        gt_store.export_tum(data_folder+'/'+traj_file, frame_ids=list(frame_ids))
+        gt_store.close()
+        if camera_formats:
+            export_cameras(gt_store.store_dir, data_folder+'/cameras', camera_formats, \
+                           name_fmt='cysto_{:06d}'+bpy.data.scenes['Scene'].render.file_extension, \
+                           json_template_fp=template_folder+'/camera_params.json' if template_folder is not None else None)
+    if save_video and template_folder is not None:
+        configure_base_data_folder(data_folder, template_folder, cysto_frame_start=0, cysto_frame_end=frame_num, \
+                                   gt_store_dir=gt_store.store_dir if save_traj else None)
     print('Scanning and rendering finished!')
+    return run_params
+
+# candidate settings for autotune_render_profile, from the lowest to the highest quality
+AUTOTUNE_LADDER = [get_render_profile('draft'), get_render_profile('draft', samples=8), get_render_profile('benchmark'), \
+                   get_render_profile('benchmark', samples=32), get_render_profile('final', samples=32), get_render_profile('final')]
+
+def autotune_render_profile(cam, frame_num, target_spf, probe_num=3, ladder=AUTOTUNE_LADDER, frame_offsets=None, threads=None):
+    # Renders probe_num frames spread over the trajectory (scene must be set up already) with
+    # increasingly expensive settings and keeps the last one within target_spf seconds per frame.
+    scene = bpy.data.scenes['Scene']
+    probe_ids = [int(k * frame_num / probe_num) for k in range(probe_num)]
+    set_render_profile(scene, ladder[0], threads)
+    set_cam_offset(cam, 0)
+    bpy.ops.render.render(animation=False, write_still=False, use_viewport=False) # warm-up: scene sync, kernels
+    best, probes = ladder[0], []
+    for settings in ladder:
+        set_render_profile(scene, settings, threads)
+        t0 = time.time()
+        for i in probe_ids:
+            set_cam_offset(cam, get_frame_offset(i, frame_num, frame_offsets))
+            bpy.ops.render.render(animation=False, write_still=False, use_viewport=False)
+        spf = (time.time() - t0) / probe_num
+        probes.append({'profile': settings, 'spf': spf})
+        print('Autotune: ' + str(settings['samples']) + ' samples, ' + str(round(spf, 2)) + ' s/frame')
+        if spf > target_spf:
+            break
+        best = settings
+    set_render_profile(scene, best, threads)
+    return best, probes
+
+def get_arc_length_table_cached(cam, traj_id, traj_scale, sample_num=2000, cache_dir=None):
+    # (offset_factor, arc length in mm) table of the current trajectory from sample_num camera positions,
+    # cached per curve geometry and scale in cache_dir (default <blend dir>/cache)
+    if cache_dir is None:
+        cache_dir = os.path.dirname(bpy.data.filepath) + '/cache'
+    cache_fp = get_arc_length_cache_file(cache_dir, traj_id, traj_scale, sample_num)
+    bpy.context.view_layer.update() # matrix_world of the curve after set_cam_trajectory changed its delta_scale
+    curve_hash = get_curve_hash(bpy.data.objects[traj_id])
+    table = load_arc_length_table(cache_fp, curve_hash)
+    if table is not None:
+        return table
+    offsets = np.linspace(0, 1, sample_num)
+    positions = get_trajectory_world_matrices(cam, sample_num, range(sample_num), offsets)[:, :3, 3]
+    mm_per_unit = bpy.context.scene.unit_settings.scale_length * 1000
+    lengths = get_arc_length_table(positions) * mm_per_unit
+    save_arc_length_table(cache_fp, curve_hash, offsets, lengths)
+    return offsets, lengths
+
+def get_arc_length_frames(cam, traj_id, traj_scale, step_mm):
+    # frame_num and offset_factor of each frame for a constant step of step_mm along the trajectory
+    offsets, lengths = get_arc_length_table_cached(cam, traj_id, traj_scale)
+    frame_num = get_frame_num_from_step(lengths[-1], step_mm)
+    print('Trajectory ' + traj_id + ' x' + format(traj_scale, 'g') + ': ' + str(round(lengths[-1], 1)) + ' mm, ' \
+          + str(frame_num) + ' frames at ' + str(step_mm) + ' mm')
+    return frame_num, get_frame_offsets(offsets, lengths, frame_num)
+
+def build_deform_cache(cache_dir, model_id, frame_num, deform_max, deform_cycle):
+    # evaluated surface of model_id for each distinct shape key value of the frames, skipped if a complete
+    # cache of the same run exists
+    meta = {'model_id': model_id, 'frame_num': frame_num, 'deform_max': deform_max, 'deform_cycle': deform_cycle}
+    if is_deform_cache_valid(cache_dir, meta):
+        return DeformCache(cache_dir)
+    model = bpy.data.objects[model_id]
+    frame_ids = np.arange(frame_num)
+    frame_values = [get_deform_value(i, frame_num, deform_max, deform_cycle) for i in frame_ids]
+    vertices, faces = get_mesh_world_arrays(model)
+    cache = DeformCache.create(cache_dir, frame_ids, frame_values, len(vertices), faces, meta)
+    for k, value in enumerate(cache.values):
+        set_deform(model, True, value)
+        cache.set_shape(k, get_mesh_world_arrays(model)[0])
+    cache.finish()
+    print('Deformation cache: ' + str(len(cache.values)) + ' shapes for ' + str(frame_num) + ' frames')
+    return cache
+
+def extract_trajectory(data_folder, frame_num, model_id, traj_id, traj_scale, frame_ids=None, traj_file='cam_wmat_tq_gt.txt', \
+                       step_mm=None):
+    # Dry run: gt trajectory of scan_and_render(save_traj=True) without rendering any frame,
+    # camera poses are evaluated straight from the depsgraph
+    init_helpers.main()
+    cam = bpy.data.objects['endo_cam']
+    set_cam_trajectory(curve_id=traj_id, delta_scale=traj_scale)
+    set_model(obj_id=model_id) # camera tracks the model
+    frame_offsets = None
+    if step_mm is not None:
+        frame_num, frame_offsets = get_arc_length_frames(cam, traj_id, traj_scale, step_mm)
+    elif frame_num is None:
+        raise ValueError('frame_num is needed without step_mm')
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+
+    # through a gt store like scan_and_render(save_traj=True), so both give the same full precision poses
+    if frame_ids is None:
+        frame_ids = range(frame_num)
+    run_params = get_run_params(frame_num=frame_num, model_id=model_id, traj_id=traj_id, traj_scale=traj_scale, step_mm=step_mm)
+    gt_store = GTStore.create(data_folder+'/'+get_gt_store_dir(traj_file), frame_num, \
+                              np.array(get_calibration_matrix_K_from_blender(cam.data)), \
+                              meta={'params': run_params, 'resolution': list(get_render_size())})
+    for i, cam_wmat in zip(frame_ids, get_trajectory_world_matrices(cam, frame_num, frame_ids, frame_offsets)):
+        gt_store.set_frame(i, cam_wmat)
+    gt_store.export_tum(data_folder+'/'+traj_file, frame_ids=list(frame_ids))
+    tum = gt_store.get_tum(list(frame_ids))
+    gt_store.close()
+    print('Trajectory extraction finished!')
+    return tum
+
+def get_trajectory_world_matrices(cam, frame_num, frame_ids, frame_offsets=None):
+    # N x 4 x 4 camera world matrices of the frames, evaluated without rendering
+    cam_wmats = np.empty((len(frame_ids), 4, 4))
+    for k, i in enumerate(frame_ids):
+        set_cam_offset(cam, get_frame_offset(i, frame_num, frame_offsets))
+        cam_wmats[k] = np.array(get_cam_world_matrix(cam))
+    return cam_wmats
+
+def extract_visibility(data_folder, frame_num, model_id, traj_id, traj_scale, frame_ids=None, vis_file='visibility.npz', \
+                       zbuffer_scale=0.25, depth_tol=0.01, step_mm=None):
+    # Dry run: pixel coordinates, depth and visibility of every model vertex in every frame (rest shape,
+    # no deformation), see projection_helpers.project_trajectory. Saved as <vis_file> in data_folder.
+    init_helpers.main()
+    cam = bpy.data.objects['endo_cam']
+    set_cam_trajectory(curve_id=traj_id, delta_scale=traj_scale)
+    set_model(obj_id=model_id) # camera tracks the model
+    frame_offsets = None
+    if step_mm is not None:
+        frame_num, frame_offsets = get_arc_length_frames(cam, traj_id, traj_scale, step_mm)
+    elif frame_num is None:
+        raise ValueError('frame_num is needed without step_mm')
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+
+    if frame_ids is None:
+        frame_ids = range(frame_num)
+    cam_wmats = get_trajectory_world_matrices(cam, frame_num, frame_ids, frame_offsets)
+    vertices, faces = get_mesh_world_arrays(bpy.data.objects[model_id])
+    width, height = get_render_size()
+    K = np.array(get_calibration_matrix_K_from_blender(cam.data))
+    t0 = time.time()
+    vis = project_trajectory(K, RT_from_world_matrices(cam_wmats), vertices, width, height, occluder=(vertices, faces), \
+                             zbuffer_scale=zbuffer_scale, depth_tol=depth_tol)
+    print('Projected ' + str(len(vertices)) + ' vertices into ' + str(len(cam_wmats)) + ' frames in ' \
+          + str(round(time.time() - t0, 2)) + 's')
+    save_visibility(data_folder+'/'+vis_file, list(frame_ids), vis)
+    print('Visibility extraction finished!')
+    return vis
+
+def extract_coverage(data_folder, frame_num, model_id, traj_id, traj_scale, frame_ids=None, target=0.95, max_angle=75, \
+                     max_distance=np.inf, cov_file='coverage', step_mm=None):
+    # Dry run: face to frame coverage index of the trajectory (rest shape) saved as <cov_file>.npz, and
+    # <cov_file>.json with the coverage and a minimal frame subset reaching target coverage, which can
+    # be passed to scan_and_render as frame_ids
+    init_helpers.main()
+    cam = bpy.data.objects['endo_cam']
+    set_cam_trajectory(curve_id=traj_id, delta_scale=traj_scale)
+    set_model(obj_id=model_id) # camera tracks the model
+    frame_offsets = None
+    if step_mm is not None:
+        frame_num, frame_offsets = get_arc_length_frames(cam, traj_id, traj_scale, step_mm)
+    elif frame_num is None:
+        raise ValueError('frame_num is needed without step_mm')
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+
+    if frame_ids is None:
+        frame_ids = range(frame_num)
+    cam_wmats = get_trajectory_world_matrices(cam, frame_num, frame_ids, frame_offsets)
+    vertices, faces = get_mesh_world_arrays(bpy.data.objects[model_id])
+    width, height = get_render_size()
+    K = np.array(get_calibration_matrix_K_from_blender(cam.data))
+    index = build_coverage_index(K, RT_from_world_matrices(cam_wmats), cam_wmats[:, :3, 3], vertices, faces, width, height, \
+                                 frame_ids=list(frame_ids))
+    index.save(data_folder+'/'+cov_file+'.npz')
+    report = get_coverage_report(index, target, max_angle, max_distance)
+    save_coverage_report(data_folder+'/'+cov_file+'.json', report)
+    print('Coverage ' + str(round(100*report['coverage'], 1)) + '%, ' + str(len(report['selected_frames'])) + ' of ' \
+          + str(report['frame_num']) + ' frames reach ' + str(round(100*target, 1)) + '% of it')
+    return index, report
 
 def generate_video_from_frames(frame_dir, vid_name, frame_rate):
-    # run matlab function in terminal
-    os.system("matlab -nodisplay -nojvm -r \"cd('/home/hpl/Documents/cysto3D/EndoVidSynthesis/evs-3d/scripts/'); convert_frames2video('"+frame_dir+"','"+vid_name+"', "+str(frame_rate)+");exit;\"")
+    # video from frames already on disk (scan_and_render encodes while rendering), no matlab needed
+    convert_frames2video(frame_dir, vid_name, frame_rate)
+#    os.system("matlab -nodisplay -nojvm -r \"cd('/home/hpl/Documents/cysto3D/EndoVidSynthesis/evs-3d/scripts/'); convert_frames2video('"+frame_dir+"','"+vid_name+"', "+str(frame_rate)+");exit;\"")
     
     # sequencer not working
 #    files = os.listdir(frame_dir)
@@ -112,8 +477,15 @@ def calc_frame_num_wconstspeed(traj_id):
     frame_num = length_dict[traj_id] * 10    
     return frame_num
 
-def configure_base_data_folder(data_folder, template_folder, cysto_frame_start, cysto_frame_end):
-    shutil.copy(template_folder+'/camera_params.json', data_folder)
+def configure_base_data_folder(data_folder, template_folder, cysto_frame_start, cysto_frame_end, gt_store_dir=None):
+    # gt_store_dir: camera_params.json gets the intrinsics of the run from its gt store, instead of the template values
+    if gt_store_dir is not None:
+        store = GTStore(gt_store_dir)
+        width, height = store.meta['resolution']
+        write_camera_params_json(data_folder+'/camera_params.json', store.K, width, height, template_folder+'/camera_params.json')
+        store.close()
+    else:
+        shutil.copy(template_folder+'/camera_params.json', data_folder)
     
     shutil.copy(template_folder+'/data_config.json', data_folder)
     file = open(data_folder+'/data_config.json', "r")
@@ -152,12 +524,18 @@ if __name__ == "__main__":
     frame_num = int(round(traj_scale*calc_frame_num_wconstspeed(traj_id)))   # note to change frame number based on traj scale   
     data_folder = '/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/Mo-Tsis_t10_s'+str(s)+'-rachTex/base_data'
 #    scan_and_render(data_folder, 'raw_cysto', frame_num, 'bladder_inner', traj_id, traj_scale, light_id, render_mode, lens_distortion, \
-#                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=True, save_video=True)                            
+#                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=True, save_video=True, \
+#                        template_folder=template_folder)
     scan_and_render(data_folder, 'raw_grid', frame_num, 'grid_inner', traj_id, traj_scale, light_id, render_mode, lens_distortion, \
                         apply_deform, deform_max, deform_cycle, save_render=True, save_traj=False, save_video=False)   
 
     data_folder = '/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/Ms-Tsis_t10_s'+str(s)+'-rachTex/base_data'
     scan_and_render(data_folder, 'raw_cysto', frame_num, 'bladder_sphere', traj_id, traj_scale, light_id, render_mode, lens_distortion, \
-                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=True, save_video=True)  
+                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=True, save_video=True, \
+                        template_folder=template_folder)
     scan_and_render(data_folder, 'raw_grid', frame_num, 'grid_sphere', traj_id, traj_scale, light_id, render_mode, lens_distortion, \
-                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=False, save_video=False)
\ No newline at end of file
+                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=False, save_video=False)
+    # or both in a single pass:
+#    scan_and_render(data_folder, 'raw_cysto', frame_num, 'bladder_sphere', traj_id, traj_scale, light_id, render_mode, lens_distortion, \
+#                        apply_deform, deform_max, deform_cycle, save_render=True, save_traj=True, save_video=True, \
+#                        grid_model_id='grid_sphere', grid_frame_fd='raw_grid', template_folder=template_folder)
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import json
+
+# Per-run manifest of scan_and_render: the full parameter set of the run plus status
+# and camera pose of every frame, so an interrupted run can be resumed without
+# re-rendering the frames that are already on disk.
+
+# parameters that change the content of the frames/trajectory of a run
+RUN_PARAM_KEYS = ['frame_fd', 'frame_num', 'model_id', 'traj_id', 'traj_scale', 'light_id', 'render_mode', \
+                  'lens_distortion', 'apply_deform', 'deform_max', 'deform_cycle', 'render_profile', \
+                  'grid_model_id', 'gt_passes', 'step_mm']
+
+def get_run_params(**kwargs):
+    return {key: kwargs[key] for key in RUN_PARAM_KEYS if key in kwargs}
+
+def open_manifest(manifest_fp, params, resume=True):
+    # reuse the manifest only if it was written by a run with the same parameters
+    if resume and os.path.exists(manifest_fp):
+        file = open(manifest_fp, "r")
+        manifest = json.load(file)
+        file.close()
+        if manifest["params"] == params:
+            return manifest
+        print('Run parameters changed, discarding manifest ' + manifest_fp)
+    manifest = {"params": params, "frames": {}}
+    save_manifest(manifest_fp, manifest)
+    return manifest
+
+def save_manifest(manifest_fp, manifest):
+    # write to a temp file first so a crash never leaves a truncated manifest behind
+    tmp_fp = manifest_fp + '.tmp'
+    file = open(tmp_fp, "w")
+    json.dump(manifest, file, sort_keys=True, indent=1, separators=(',', ': '))
+    file.close()
+    os.replace(tmp_fp, manifest_fp)
+
+def is_image_file_valid(img_fp):
+    if not os.path.exists(img_fp) or os.path.getsize(img_fp) == 0:
+        return False
+    # catch frames that were cut off while being written
+    file = open(img_fp, "rb")
+    if os.path.getsize(img_fp) > 12:
+        file.seek(-12, os.SEEK_END)
+    tail = file.read()
+    file.close()
+    ext = os.path.splitext(img_fp)[1].lower()
+    if ext in ['.jpg', '.jpeg']:
+        return tail.endswith(b'\xff\xd9')
+    if ext == '.png':
+        return b'IEND' in tail
+    return True
+
+def is_frame_done(manifest, frame_id, img_fp=None, extra_fps=()):
+    # img_fp: rendered frame on disk, None if frames are not saved by the run;
+    # extra_fps: other images of the frame (grid image, gt passes), which must be there too
+    frame = manifest["frames"].get(str(frame_id))
+    if frame is None or frame["status"] != 'done':
+        return False
+    return (img_fp is None or is_image_file_valid(img_fp)) and all(is_image_file_valid(fp) for fp in extra_fps)
+
+def get_frame_tq(manifest, frame_id):
+    return manifest["frames"][str(frame_id)]["tq"]
+
+def set_frame_status(manifest_fp, manifest, frame_id, status, tq=None, save=True):
+    frame = {"status": status}
+    if tq is not None:
+        frame["tq"] = [float(_) for _ in tq]
+    manifest["frames"][str(frame_id)] = frame
+    if save:
+        save_manifest(manifest_fp, manifest)
@@ -0,0 +1,151 @@
+import numpy as np
+from sync_helpers import get_frame_ids, associate_models, get_matched_matrices, get_association_summary
+
+# Trajectory error metrics on N x 4 x 4 pose stacks, pure numpy, with the definitions of evo
+# (https://github.com/MichaelGrupp/evo) so results match evo_eval.ipynb:
+#   alignment  Sim(3) Umeyama of the estimated positions to the reference, applied as in
+#              PoseTrajectory3D.align: translations scaled by s, then [r|t] from the left
+#   APE        E_i = inv(Q_i) P_i (Q reference, P estimate)
+#   RPE        E_ij = inv(inv(Q_i) Q_j) inv(P_i) P_j, consecutive ids range(0, N, delta) (frames unit)
+# and the errors of each pose relation:
+#   'full'   ||E - I||_F    'trans'  ||t||, APE: ||t_est - t_ref||    'rot'  ||R_E - I||_F
+# Statistics are those of evo's get_all_statistics (std without Bessel's correction).
+
+POSE_RELATIONS = ['full', 'trans', 'rot']
+
+# ----------------------------------------------------------
+def umeyama_alignment(x, y, with_scale=True):
+    # r, t, s minimizing sum ||y_i - (s r x_i + t)||^2, x and y N x 3 corresponding points
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(x) < 2:
+        raise ValueError('Umeyama alignment needs at least 2 points, got ' + str(len(x)))
+    mean_x, mean_y = x.mean(axis=0), y.mean(axis=0)
+    sigma_x = np.sum((x - mean_x)**2) / len(x)
+    cov_xy = (y - mean_y).T @ (x - mean_x) / len(x)
+    u, d, v = np.linalg.svd(cov_xy)
+    S = np.eye(3)
+    if np.linalg.det(u) * np.linalg.det(v) < 0:
+        S[2, 2] = -1
+    r = u @ S @ v
+    s = np.trace(np.diag(d) @ S) / sigma_x if with_scale else 1.0
+    t = mean_y - s * r @ mean_x
+    return r, t, s
+
+def apply_alignment(M, r, t, s=1.0):
+    # N x 4 x 4 poses -> [r|t] @ poses with translations scaled by s first
+    aligned = np.array(M, dtype=np.float64)
+    aligned[:, :3, 3] *= s
+    T = np.eye(4)
+    T[:3, :3], T[:3, 3] = r, t
+    return T @ aligned
+
+def align_matrices(M_est, M_ref, with_scale=True):
+    # estimated poses aligned to the reference on their positions, and the alignment
+    r, t, s = umeyama_alignment(M_est[:, :3, 3], M_ref[:, :3, 3], with_scale)
+    return apply_alignment(M_est, r, t, s), (r, t, s)
+
+def inv_se3(M):
+    # inverse of N x 4 x 4 rigid transforms (R^T, -R^T t)
+    Rt = np.swapaxes(M[:, :3, :3], 1, 2)
+    inv = np.zeros_like(M)
+    inv[:, :3, :3] = Rt
+    inv[:, :3, 3] = -np.einsum('nij,nj->ni', Rt, M[:, :3, 3])
+    inv[:, 3, 3] = 1
+    return inv
+
+# ----------------------------------------------------------
+def get_relation_errors(E, trans=None):
+    # {pose relation: N errors} of N x 4 x 4 error transforms; trans: N x 3 translation errors if not those of E
+    trans = E[:, :3, 3] if trans is None else trans
+    return {'full': np.linalg.norm((E - np.eye(4)).reshape(len(E), -1), axis=1), \
+            'trans': np.linalg.norm(trans, axis=1), \
+            'rot': np.linalg.norm((E[:, :3, :3] - np.eye(3)).reshape(len(E), -1), axis=1)}
+
+def get_ape_errors(M_ref, M_est):
+    return get_relation_errors(inv_se3(M_ref) @ M_est, M_est[:, :3, 3] - M_ref[:, :3, 3])
+
+def get_rpe_ids(pose_num, delta=1):
+    # (i, j) pairs of consecutive ids 0, delta, 2*delta, ...
+    ids = np.arange(0, pose_num, delta)
+    return ids[:-1], ids[1:]
+
+def get_rpe_errors(M_ref, M_est, delta=1):
+    i, j = get_rpe_ids(len(M_ref), delta)
+    Q_rel = inv_se3(M_ref[i]) @ M_ref[j]
+    P_rel = inv_se3(M_est[i]) @ M_est[j]
+    return get_relation_errors(inv_se3(Q_rel) @ P_rel)
+
+def get_stats(errors):
+    errors = np.asarray(errors, dtype=np.float64)
+    if len(errors) == 0:
+        return {'rmse': np.nan, 'mean': np.nan, 'median': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan, 'sse': 0.0}
+    sse = float(np.dot(errors, errors))
+    return {'rmse': float(np.sqrt(sse / len(errors))), 'mean': float(np.mean(errors)), 'median': float(np.median(errors)), \
+            'std': float(np.std(errors)), 'min': float(np.min(errors)), 'max': float(np.max(errors)), 'sse': sse}
+
+# ----------------------------------------------------------
+def evaluate_matrices(M_ref, M_est, deltas=(1,), align=True, with_scale=True):
+    # APE and RPE (for every delta, in frames) statistics of all pose relations of matched poses:
+    #   {'pose_num': N, 'alignment': {'r', 't', 's'}, 'ape': {relation: stats}, 'rpe': {delta: {relation: stats}}}
+    result = {'pose_num': len(M_ref)}
+    if align:
+        M_est, (r, t, s) = align_matrices(M_est, M_ref, with_scale)
+        result['alignment'] = {'r': r.tolist(), 't': t.tolist(), 's': float(s)}
+    result['ape'] = {relation: get_stats(errors) for relation, errors in get_ape_errors(M_ref, M_est).items()}
+    result['rpe'] = {}
+    for delta in deltas:
+        errors = get_rpe_errors(M_ref, M_est, delta)
+        result['rpe'][delta] = {relation: get_stats(errors[relation]) for relation in POSE_RELATIONS}
+    return result
+
+def evaluate_trajectory(tum_ref, tum_est, deltas=(1,), align=True, with_scale=True):
+    # statistics of an estimated TUM trajectory, poses matched on their frame index (see sync_helpers.py)
+    ref_rows, est_rows = associate_models(tum_ref, tum_est)['pairs'][0]
+    M_ref, M_est = get_matched_matrices(tum_ref, tum_est, ref_rows, est_rows)
+    return evaluate_matrices(M_ref, M_est, deltas, align, with_scale)
+
+def evaluate_models(tum_ref, tums_est, deltas=(1,), align=True, with_scale=True):
+    # statistics of every sub-model ({model index: TUM rows}, each aligned on its own) and the
+    # association of all of them with the gt (registered/dropped frames, segments)
+    association = associate_models(tum_ref, tums_est)
+    results = {'association': get_association_summary(association), 'models': {}}
+    for model, (ref_rows, est_rows) in association['pairs'].items():
+        if len(ref_rows) >= 2:
+            M_ref, M_est = get_matched_matrices(tum_ref, tums_est[model], ref_rows, est_rows)
+            results['models'][model] = evaluate_matrices(M_ref, M_est, deltas, align, with_scale)
+    return results
+
+def evaluate_segments(tum_ref, tums_est, deltas=(1,), min_len=2, with_scale=True):
+    # APE/RPE statistics per segment of registered frames; each model is aligned once on all its
+    # matched poses, its errors are then split by segment. Segments shorter than min_len are skipped.
+    tums_est = tums_est if isinstance(tums_est, dict) else {0: tums_est}
+    association = associate_models(tum_ref, tums_est)
+    frame_ids = association['frame_ids']
+    results = []
+    for model, tum_est in tums_est.items():
+        ref_rows, est_rows = association['pairs'][model]
+        if len(ref_rows) < 2:
+            continue
+        M_ref, M_est = get_matched_matrices(tum_ref, tum_est, ref_rows, est_rows)
+        M_est, _ = align_matrices(M_est, M_ref, with_scale)
+        matched_ids = np.sort(get_frame_ids(tum_ref[ref_rows]))
+        for label, start, end in association['segments']:
+            if label != model or end - start < min_len:
+                continue
+            k0, k1 = np.searchsorted(matched_ids, [frame_ids[start], frame_ids[end - 1] + 1])
+            segment = {'model': model, 'frames': [int(frame_ids[start]), int(frame_ids[end - 1])], 'pose_num': int(k1 - k0)}
+            ape = get_ape_errors(M_ref[k0:k1], M_est[k0:k1])
+            segment['ape'] = {relation: get_stats(ape[relation]) for relation in POSE_RELATIONS}
+            segment['rpe'] = {}
+            for delta in deltas:
+                rpe = get_rpe_errors(M_ref[k0:k1], M_est[k0:k1], delta)
+                segment['rpe'][delta] = {relation: get_stats(rpe[relation]) for relation in POSE_RELATIONS}
+            results.append(segment)
+    return results
+
+def get_pe_means(result, delta=1):
+    # ape_RT, rpe_RT, ape_T, rpe_T, ape_R, rpe_R means, the values of all_eval.ipynb
+    means = []
+    for relation in POSE_RELATIONS:
+        means += [result['ape'][relation]['mean'], result['rpe'][delta][relation]['mean']]
+    return tuple(means)
@@ -0,0 +1,143 @@
+import os
+import json
+import numpy as np
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+from ply_helpers import read_ply_points
+
+# Accuracy/completeness of reconstructed surfaces, in Python instead of the ETH3D
+# multi-view-evaluation binary (see mv_eval.sh). The gt surface (sgt.mlp, a MeshLab project
+# of PLY files and their transforms) is loaded once and indexed with a KD-tree that every
+# reconstruction reuses; the distances are computed once per reconstruction and give the
+# scores at every tolerance:
+#   accuracy      fraction of reconstructed points within the tolerance of the gt
+#   completeness  fraction of gt points within the tolerance of the reconstruction
+#   f_score       harmonic mean of both
+# Meshes are sampled uniformly on their faces (spacing of a fraction of the smallest
+# tolerance) in addition to their vertices. The three reconstructions of an experiment are
+# evaluated in threads (the KD-tree queries release the GIL), e.g.
+#   python mv_eval.py /data/Ms-Tsis_t10_s1 --mlp /data/templates/sgt.mlp --tolerances 0.02 0.04 0.08
+
+RECON_FILES = {'orig': '/base_experiment/mesh/orig_point_cloud_post.ply', \
+               'smooth': '/base_experiment/mesh/smooth_point_cloud_w_normals_post.ply', \
+               'mesh': '/base_experiment/mesh/mesh_post.ply'}
+MV_RESULTS = '/base_experiment/mv_eval.json'
+TOLERANCES = [0.01, 0.02, 0.04, 0.08, 0.16]
+SUMMARY_TOLERANCE = 0.04 # tolerance of the summary csv columns, the one of mv_eval.sh
+
+# ----------------------------------------------------------
+def read_mlp(mlp_fp):
+    # [(ply file path, 4 x 4 transform)] of a MeshLab project
+    root = ET.parse(mlp_fp).getroot()
+    meshes = []
+    for mesh in root.iter('MLMesh'):
+        filepath = os.path.join(os.path.dirname(os.path.abspath(mlp_fp)), mesh.get('filename'))
+        matrix = mesh.find('MLMatrix44')
+        T = np.array(matrix.text.split(), dtype=np.float64).reshape(4, 4) if matrix is not None else np.eye(4)
+        meshes.append((filepath, T))
+    return meshes
+
+def sample_mesh(points, faces, spacing, max_num=20000000, seed=0):
+    # points spread uniformly on the triangles, about one per spacing^2 of area
+    a, b, c = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+    area = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    num = int(min(area.sum() / spacing**2, max_num))
+    if num == 0:
+        return np.zeros((0, 3))
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(len(faces), num, p=area / area.sum())
+    u, v = rng.random(num), rng.random(num)
+    flip = u + v > 1
+    u[flip], v[flip] = 1 - u[flip], 1 - v[flip]
+    return a[ids] + u[:, None]*(b[ids] - a[ids]) + v[:, None]*(c[ids] - a[ids])
+
+def get_surface_points(filepath, spacing, T=None):
+    # vertices (only xyz is read, see ply_helpers.py) and samples on the faces of meshes
+    points, faces = read_ply_points(filepath)
+    if faces is not None:
+        points = np.vstack([points, sample_mesh(points, faces, spacing)])
+    if T is not None:
+        points = points @ T[:3, :3].T + T[:3, 3]
+    return points
+
+class GTSurface:
+    # gt points and their KD-tree, built once and shared by the evaluations (and threads)
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.tree = cKDTree(self.points)
+
+    @classmethod
+    def from_mlp(cls, mlp_fp, spacing=min(TOLERANCES) / 4):
+        return cls(np.vstack([get_surface_points(filepath, spacing, T) for filepath, T in read_mlp(mlp_fp)]))
+
+_gt_surfaces = {}
+
+def get_gt_surface(mlp_fp, spacing=min(TOLERANCES) / 4):
+    # cached per process
+    key = (os.path.abspath(mlp_fp), spacing)
+    if key not in _gt_surfaces:
+        _gt_surfaces[key] = GTSurface.from_mlp(mlp_fp, spacing)
+    return _gt_surfaces[key]
+
+# ----------------------------------------------------------
+def get_scores(acc_dist, comp_dist, tolerances):
+    # scores at every tolerance from the sorted distances
+    acc_dist, comp_dist = np.sort(acc_dist), np.sort(comp_dist)
+    tolerances = np.asarray(tolerances, dtype=np.float64)
+    accuracy = np.searchsorted(acc_dist, tolerances, side='right') / max(len(acc_dist), 1)
+    completeness = np.searchsorted(comp_dist, tolerances, side='right') / max(len(comp_dist), 1)
+    denom = accuracy + completeness
+    f_score = np.divide(2*accuracy*completeness, denom, out=np.zeros_like(denom), where=denom > 0)
+    return {'tolerances': tolerances.tolist(), 'accuracy': accuracy.tolist(), 'completeness': completeness.tolist(), \
+            'f_score': f_score.tolist()}
+
+def evaluate_points(gt, points, tolerances=TOLERANCES):
+    # distances beyond the largest tolerance are not needed (inf), which keeps the queries of far points cheap
+    points = np.asarray(points, dtype=np.float64)
+    bound = max(tolerances) * (1 + 1e-9)
+    acc_dist = gt.tree.query(points, distance_upper_bound=bound, workers=-1)[0] if len(points) else np.zeros(0)
+    comp_dist = cKDTree(points).query(gt.points, distance_upper_bound=bound, workers=-1)[0] if len(points) \
+                else np.full(len(gt.points), np.inf)
+    result = get_scores(acc_dist, comp_dist, tolerances)
+    result['point_num'] = len(points)
+    return result
+
+def evaluate_file(gt, filepath, tolerances=TOLERANCES):
+    return evaluate_points(gt, get_surface_points(filepath, min(tolerances) / 4), tolerances)
+
+def evaluate_reconstructions(ex_dir, gt, tolerances=TOLERANCES, thread_num=len(RECON_FILES), save=True):
+    # {reconstruction name: scores} of the files of an experiment that exist, saved to mv_eval.json
+    names = [name for name, filepath in RECON_FILES.items() if os.path.exists(ex_dir + filepath)]
+    executor = ThreadPoolExecutor(thread_num)
+    futures = {name: executor.submit(evaluate_file, gt, ex_dir + RECON_FILES[name], tolerances) for name in names}
+    results = {name: future.result() for name, future in futures.items()}
+    executor.shutdown()
+    if save:
+        file = open(ex_dir + MV_RESULTS, "w")
+        json.dump(results, file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+    return results
+
+def get_summary_row(results, tolerance=SUMMARY_TOLERANCE):
+    # {column: value} of the summary csv, e.g. orig_acc, orig_comp, orig_F at one tolerance
+    row = {}
+    for name, result in results.items():
+        k = int(np.argmin(np.abs(np.array(result['tolerances']) - tolerance)))
+        row[name + '_acc'] = str(round(result['accuracy'][k], 4))
+        row[name + '_comp'] = str(round(result['completeness'][k], 4))
+        row[name + '_F'] = str(round(result['f_score'][k], 4))
+    return row
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Accuracy/completeness of reconstructed surfaces.')
+    parser.add_argument('ex_dirs', nargs='+', help='experiment folders')
+    parser.add_argument('--mlp', required=True, help='gt MeshLab project, e.g. templates/sgt.mlp')
+    parser.add_argument('--tolerances', type=float, nargs='+', default=TOLERANCES)
+    args = parser.parse_args()
+    gt = GTSurface.from_mlp(args.mlp, min(args.tolerances) / 4)
+    for ex_dir in args.ex_dirs:
+        results = evaluate_reconstructions(ex_dir, gt, args.tolerances)
+        for name, result in results.items():
+            print(ex_dir, name, 'accuracy', result['accuracy'], 'completeness', result['completeness'], 'F', result['f_score'])
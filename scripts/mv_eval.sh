@@ -1,6 +1,7 @@
 #!/bin/bash
 #
 
+script_dir=$(cd "$(dirname "$0")" && pwd)
 cd '/home/hpl/multi-view-evaluation'
 
 
@@ -33,10 +34,13 @@ orig_dir=$ex_dir'/base_experiment/mesh/orig_point_cloud_post.ply'
 smoo_dir=$ex_dir'/base_experiment/mesh/smooth_point_cloud_w_normals_post.ply'
 mesh_dir=$ex_dir'/base_experiment/mesh/mesh_post.ply'
 gt_dir='/home/hpl/Documents/cysto3D/EndoVidSynthesis/data/templates/sgt.mlp'
-./ETH3DMultiViewEvaluation --reconstruction_ply_path $orig_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
+#./ETH3DMultiViewEvaluation --reconstruction_ply_path $orig_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
 
-./ETH3DMultiViewEvaluation --reconstruction_ply_path $smoo_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
+#./ETH3DMultiViewEvaluation --reconstruction_ply_path $smoo_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
 
-./ETH3DMultiViewEvaluation --reconstruction_ply_path $mesh_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
+#./ETH3DMultiViewEvaluation --reconstruction_ply_path $mesh_dir --ground_truth_mlp_path $gt_dir --tolerances 0.04
+
+# all three reconstructions in one call, gt loaded once, results in $ex_dir/base_experiment/mv_eval.json
+python $script_dir/mv_eval.py $ex_dir --mlp $gt_dir --tolerances 0.01 0.02 0.04 0.08 0.16
 
 # bash /home/hpl/Documents/cysto3D/EndoVidSynthesis/evs-3d/scripts/mv_eval.sh
@@ -0,0 +1,141 @@
+import sys
+import csv
+import json
+import time
+import contextlib
+import numpy as np
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+# Per-frame instrumentation of scan_and_render: timings of each stage of a frame, peak RSS
+# and Blender datablock counts, written as <frame_fd>_profile.json/.csv with a summary
+# (p50/p95 per stage and throughput) of the run.
+
+def get_peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB on Linux
+
+class FrameProfiler:
+    def __init__(self, enabled=True, datablock_counter=None):
+        # enabled: False turns all calls into no-ops, so callers don't need to check
+        # datablock_counter: callable returning {datablock type: count}, e.g. get_datablock_counts
+        self.enabled = enabled
+        self.datablock_counter = datablock_counter
+        self.frames = []
+        self.frame = None
+        self.t_start = time.time()
+
+    def start_frame(self, frame_id):
+        if not self.enabled:
+            return
+        self.frame = {'frame': frame_id}
+        self.t_frame = time.time()
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.time()
+        yield
+        self.add(name, time.time() - t0)
+
+    def add(self, name, value):
+        if not self.enabled:
+            return
+        self.frame[name] = self.frame.get(name, 0) + value
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frame['total'] = time.time() - self.t_frame
+        self.frame['peak_rss_mb'] = get_peak_rss_mb()
+        if self.datablock_counter is not None:
+            self.frame.update(('n_' + key, value) for key, value in self.datablock_counter().items())
+        self.frames.append(self.frame)
+        self.frame = None
+
+    def get_summary(self):
+        wall_time = time.time() - self.t_start
+        keys = sorted(set(key for frame in self.frames for key in frame.keys()) - {'frame'})
+        summary = {'frames': len(self.frames), 'wall_time': wall_time, \
+                   'fps': len(self.frames) / wall_time if wall_time > 0 else 0.0, 'stages': {}}
+        for key in keys:
+            values = np.array([frame.get(key, 0) for frame in self.frames], dtype=np.float64)
+            summary['stages'][key] = {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)), \
+                                      'mean': float(values.mean()), 'max': float(values.max()), 'sum': float(values.sum())}
+        return summary
+
+    def save(self, filepath_prefix):
+        summary = self.get_summary()
+        file = open(filepath_prefix + '.json', "w")
+        json.dump({'summary': summary, 'frames': self.frames}, file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+        keys = ['frame'] + list(summary['stages'].keys())
+        file = open(filepath_prefix + '.csv', "w", newline='')
+        writer = csv.DictWriter(file, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(self.frames)
+        file.close()
+        return summary
+
+def print_profile_summary(summary):
+    print('Profile: ' + str(summary['frames']) + ' frames in ' + str(round(summary['wall_time'], 1)) + 's, ' \
+          + str(round(summary['fps'], 3)) + ' frames/s')
+    for key, stats in sorted(summary['stages'].items()):
+        print('  ' + key.ljust(16) + ' p50 ' + format(stats['p50'], '.4f') + '  p95 ' + format(stats['p95'], '.4f'))
+
+# ----------------------------------------------------------
+# Blender side
+DATABLOCK_TYPES = ['objects', 'meshes', 'materials', 'images', 'textures', 'node_groups', 'curves']
+
+def get_datablock_counts():
+    import bpy
+    return {key: len(getattr(bpy.data, key)) for key in DATABLOCK_TYPES}
+
+class RenderStageTimer:
+    # Splits one bpy.ops.render.render call into render / compositor / file write time using render
+    # handlers: the render stats switch to 'Compositing' when the compositor starts, render_write fires
+    # once the image is saved. Stats come from the render engine, so the split is approximate.
+    def __init__(self):
+        self.handlers = {'render_pre': self._on_pre, 'render_stats': self._on_stats, 'render_write': self._on_write}
+
+    def register(self):
+        import bpy
+        for name, handler in self.handlers.items():
+            getattr(bpy.app.handlers, name).append(handler)
+
+    def unregister(self):
+        import bpy
+        for name, handler in self.handlers.items():
+            if handler in getattr(bpy.app.handlers, name):
+                getattr(bpy.app.handlers, name).remove(handler)
+
+    def _on_pre(self, *args):
+        self.t_pre = time.time()
+        self.t_composite = None
+        self.t_stats = None
+        self.t_write = None
+
+    def _on_stats(self, *args):
+        t = time.time()
+        stats = [arg for arg in args if isinstance(arg, str)]
+        if self.t_composite is None and stats and 'Compositing' in stats[0]:
+            self.t_composite = t
+        self.t_stats = t
+
+    def _on_write(self, *args):
+        self.t_write = time.time()
+
+    def get_stages(self, t_end):
+        # t_end: time when the render call returned
+        t_done = self.t_stats if self.t_stats is not None else t_end
+        t_composite = self.t_composite if self.t_composite is not None else t_done
+        stages = {'render': t_composite - self.t_pre, 'composite': t_done - t_composite}
+        if self.t_write is not None:
+            stages['write'] = self.t_write - t_done
+        return stages
@@ -0,0 +1,212 @@
+import itertools
+import numpy as np
+
+# Reading of large PLY files (reconstructed point clouds and meshes of tens of millions of
+# points) without loading them whole:
+#   binary   the body is memory-mapped, each element is a NumPy structured array (np.memmap)
+#            on the file, nothing is copied until the data is used
+#   ascii    the body is read in chunks of rows, only the selected properties are kept
+# Properties can be selected by name, e.g. xyz without normals and colors:
+#   ply = PlyFile('/data/run/base_experiment/mesh/orig_point_cloud_post.ply')
+#   points = ply.read_points()                          # N x 3 float64
+#   faces = ply.read_element('face', ['vertex_indices']) # F structured, field F x 3
+# List properties (vertex_indices of faces) must have the same length in every row, they
+# become N x n fields.
+
+PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2', \
+             'ushort': 'u2', 'uint16': 'u2', 'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4', \
+             'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+BYTE_ORDERS = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': '='}
+
+def read_ply_header(file):
+    # format, [(element name, count, [(property name, type, list count type or None)])] and the header size
+    if file.readline().strip() != b'ply':
+        raise ValueError('Not a PLY file')
+    fmt, elements = None, []
+    while True:
+        line = file.readline()
+        if not line:
+            raise ValueError('PLY header without end_header')
+        tokens = line.decode('ascii').split()
+        if not tokens or tokens[0] in ['comment', 'obj_info']:
+            continue
+        if tokens[0] == 'end_header':
+            return fmt, elements, file.tell()
+        if tokens[0] == 'format':
+            fmt = tokens[1]
+        elif tokens[0] == 'element':
+            elements.append((tokens[1], int(tokens[2]), []))
+        elif tokens[0] == 'property' and tokens[1] == 'list':
+            elements[-1][2].append((tokens[4], PLY_TYPES[tokens[3]], PLY_TYPES[tokens[2]]))
+        elif tokens[0] == 'property':
+            elements[-1][2].append((tokens[2], PLY_TYPES[tokens[1]], None))
+
+class PlyFile:
+    def __init__(self, filepath, chunk_rows=1000000):
+        # chunk_rows: rows per chunk of ascii bodies
+        self.filepath = filepath
+        self.chunk_rows = chunk_rows
+        file = open(filepath, "rb")
+        self.format, elements, self.header_size = read_ply_header(file)
+        if self.format not in BYTE_ORDERS:
+            raise ValueError('Unknown PLY format ' + str(self.format))
+        self.order = BYTE_ORDERS[self.format]
+        # per element: count, row dtype (binary) or row length in tokens (ascii), and byte offset or first line
+        self.elements = {}
+        pos = self.header_size if self.format != 'ascii' else 0
+        for name, count, props in elements:
+            list_lens = self._get_list_lens(file, pos, count, props)
+            dtype = self._get_dtype(props, list_lens)
+            row_len = sum(1 + list_lens[p[0]] if p[2] is not None else 1 for p in props)
+            self.elements[name] = {'name': name, 'count': count, 'props': props, 'list_lens': list_lens, 'dtype': dtype, \
+                                   'row_len': row_len, 'pos': pos}
+            pos += dtype.itemsize * count if self.format != 'ascii' else count
+        file.close()
+
+    def _get_list_lens(self, file, pos, count, props):
+        # lengths of the list properties, from the first row
+        list_lens = {}
+        if not any(p[2] is not None for p in props):
+            return list_lens
+        if self.format == 'ascii':
+            file.seek(self.header_size)
+            line = next(itertools.islice(file, pos, None), b'') if count else b''
+            tokens, k = line.split(), 0
+            for prop_name, prop_type, count_type in props:
+                if count_type is not None:
+                    list_lens[prop_name] = int(tokens[k]) if count else 0
+                    k += 1 + list_lens[prop_name]
+                else:
+                    k += 1
+            return list_lens
+        offset = pos
+        for prop_name, prop_type, count_type in props:
+            if count_type is None:
+                offset += np.dtype(prop_type).itemsize
+                continue
+            file.seek(offset)
+            count_dtype = np.dtype(self.order + count_type)
+            list_lens[prop_name] = int(np.frombuffer(file.read(count_dtype.itemsize), count_dtype)[0]) if count else 0
+            offset += count_dtype.itemsize + list_lens[prop_name] * np.dtype(prop_type).itemsize
+        return list_lens
+
+    def _get_dtype(self, props, list_lens):
+        fields = []
+        for prop_name, prop_type, count_type in props:
+            if count_type is not None:
+                fields += [(prop_name + '_count', self.order + count_type), \
+                           (prop_name, self.order + prop_type, (list_lens[prop_name],))]
+            else:
+                fields.append((prop_name, self.order + prop_type))
+        return np.dtype(fields)
+
+    def get_count(self, name):
+        return self.elements[name]['count'] if name in self.elements else 0
+
+    def get_property_names(self, name):
+        return [p[0] for p in self.elements[name]['props']]
+
+    # ----------------------------------------------------------
+    def read_element(self, name, properties=None):
+        # structured array of an element with the given properties (default all); binary: a view on the
+        # memory-mapped file (read only), ascii: read in chunks into an array of the selected properties
+        element = self.elements[name]
+        properties = properties or self.get_property_names(name)
+        if self.format == 'ascii':
+            return self._read_ascii_element(element, properties)
+        if element['count'] == 0:
+            return np.zeros(0, element['dtype'])[properties]
+        array = np.memmap(self.filepath, dtype=element['dtype'], mode='r', offset=element['pos'], shape=(element['count'],))
+        self._check_list_lens(array, element, properties)
+        return array[properties]
+
+    def _check_list_lens(self, rows, element, properties):
+        for prop_name, length in element['list_lens'].items():
+            if prop_name in properties and np.any(rows[prop_name + '_count'] != length):
+                raise ValueError('PLY list ' + prop_name + ' with rows of different length')
+
+    def _get_columns(self, element, properties):
+        # token columns of the selected properties in an ascii row
+        columns, col = {}, 0
+        for prop_name, prop_type, count_type in element['props']:
+            if count_type is not None:
+                columns[prop_name + '_count'] = col
+                columns[prop_name] = np.arange(col + 1, col + 1 + element['list_lens'][prop_name])
+                col += 1 + element['list_lens'][prop_name]
+            else:
+                columns[prop_name] = col
+                col += 1
+        return columns
+
+    def iter_chunks(self, name, properties=None, chunk_rows=None):
+        # structured arrays of at most chunk_rows rows of the selected properties, e.g. to reduce a cloud
+        # (bounding box, subsampling, ...) without holding it in memory; binary chunks are views on the file
+        element = self.elements[name]
+        properties = properties or self.get_property_names(name)
+        chunk_rows = chunk_rows or self.chunk_rows
+        if self.format != 'ascii':
+            array = self.read_element(name, properties)
+            for start in range(0, len(array), chunk_rows):
+                yield array[start:start + chunk_rows]
+            return
+        dtype = np.dtype([d for d in element['dtype'].descr if d[0] in properties])
+        columns = self._get_columns(element, properties)
+        file = open(self.filepath, "rb")
+        file.seek(self.header_size)
+        lines = itertools.islice(file, element['pos'], element['pos'] + element['count'])
+        while True:
+            chunk = list(itertools.islice(lines, chunk_rows))
+            if not chunk:
+                break
+            tokens = np.array(b' '.join(chunk).split(), dtype=np.float64)
+            if len(tokens) != len(chunk) * element['row_len']:
+                file.close()
+                raise ValueError('PLY element ' + name + ' with rows of different length')
+            tokens = tokens.reshape(len(chunk), element['row_len'])
+            rows = np.zeros(len(chunk), dtype)
+            for prop_name in properties:
+                rows[prop_name] = tokens[:, columns[prop_name]]
+                if prop_name in element['list_lens'] and np.any(tokens[:, columns[prop_name + '_count']] != \
+                                                                element['list_lens'][prop_name]):
+                    file.close()
+                    raise ValueError('PLY list ' + prop_name + ' with rows of different length')
+            yield rows
+        file.close()
+
+    def _read_ascii_element(self, element, properties):
+        dtype = np.dtype([d for d in element['dtype'].descr if d[0] in properties])
+        array = np.zeros(element['count'], dtype)
+        start = 0
+        for rows in self.iter_chunks(element['name'], properties):
+            array[start:start + len(rows)] = rows
+            start += len(rows)
+        return array
+
+    # ----------------------------------------------------------
+    def read_points(self, dtype=np.float64, properties=('x', 'y', 'z'), name='vertex'):
+        # N x len(properties) array, filled chunk by chunk (the only full size allocation)
+        points = np.empty((self.get_count(name), len(properties)), dtype)
+        start = 0
+        for rows in self.iter_chunks(name, list(properties)):
+            for k, prop_name in enumerate(properties):
+                points[start:start + len(rows), k] = rows[prop_name]
+            start += len(rows)
+        return points
+
+    def read_faces(self, dtype=np.int64):
+        # F x n vertex indices, None without faces
+        if self.get_count('face') == 0:
+            return None
+        prop_name = 'vertex_indices' if 'vertex_indices' in self.get_property_names('face') else 'vertex_index'
+        return np.asarray(self.read_element('face', [prop_name])[prop_name], dtype=dtype)
+
+def read_ply(filepath, properties=None):
+    # {element name: structured array}; properties: {element name: property names} to read only those
+    ply = PlyFile(filepath)
+    properties = properties or {}
+    return {name: ply.read_element(name, properties.get(name)) for name in ply.elements}
+
+def read_ply_points(filepath, dtype=np.float64):
+    # N x 3 vertices and F x n faces (None for point clouds)
+    ply = PlyFile(filepath)
+    return ply.read_points(dtype), ply.read_faces()
@@ -0,0 +1,115 @@
+import numpy as np
+
+# Batch projection of a whole trajectory, pure numpy: every point of a model into every
+# camera pose at once, with an in-frustum test and an occlusion test against a z-buffer of
+# the model triangles. Cameras are given as K (3 x 3) and N x 3(4) x 4 world to cv camera
+# transforms, see geom_helpers.RT_from_world_matrices. Pixel coordinates have the origin at
+# the top-left corner (as project_by_object_utils in get_helpers.py), lens distortion of the
+# compositor is not applied.
+
+# ----------------------------------------------------------
+def project_points(K, RT, points):
+    # points: V x 3 world coordinates -> pixel coordinates N x V x 2, depth N x V (along the optical axis)
+    K = np.asarray(K, dtype=np.float64)
+    RT = np.asarray(RT, dtype=np.float64).reshape(-1, np.shape(RT)[-2], 4)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    p_cam = points @ np.transpose(RT[:, :3, :3], (0, 2, 1)) + RT[:, None, :3, 3]
+    depth = p_cam[..., 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xy = p_cam[..., :2] / depth[..., None]
+    uv = xy @ K[:2, :2].T + K[:2, 2]
+    return uv, depth
+
+def get_in_frustum(uv, depth, width, height, near=1e-6):
+    return (depth > near) & (uv[..., 0] >= 0) & (uv[..., 0] < width) & (uv[..., 1] >= 0) & (uv[..., 1] < height)
+
+# ----------------------------------------------------------
+def render_zbuffer(uv, depth, faces, width, height, near=1e-6, max_subdiv=32):
+    # Depth of the closest triangle per pixel of a width x height grid, inf where nothing is seen.
+    # uv, depth: projected vertices of one camera (V x 2, V); faces: F x 3 vertex indices.
+    # Triangles are rasterized by sampling them on a barycentric grid fine enough for their
+    # projected size (up to max_subdiv steps per edge) and interpolating 1/depth, which is linear
+    # in screen space. Triangles crossing the near plane are skipped.
+    zbuf = np.full(height * width, np.inf)
+    tri_uv = uv[faces]                      # F x 3 x 2
+    tri_depth = depth[faces]                # F x 3
+    keep = np.all(tri_depth > near, axis=1)
+    keep &= np.all(tri_uv.max(axis=1) >= 0, axis=1) & (tri_uv[:, :, 0].min(axis=1) < width) \
+            & (tri_uv[:, :, 1].min(axis=1) < height)
+    tri_uv, tri_inv = tri_uv[keep], 1 / tri_depth[keep]
+    edge = np.linalg.norm(tri_uv - np.roll(tri_uv, 1, axis=1), axis=2).max(axis=1)
+    subdiv = np.clip(np.ceil(edge * 2), 1, max_subdiv).astype(np.int64)
+    for n in np.unique(subdiv):
+        sel = subdiv == n
+        i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing='ij')
+        i, j = i[i + j <= n], j[i + j <= n]
+        bary = np.stack([n - i - j, i, j], axis=1) / n # S x 3
+        sample_uv = (bary @ tri_uv[sel]).reshape(-1, 2)
+        sample_depth = 1 / (tri_inv[sel] @ bary.T).ravel()
+        col, row = np.floor(sample_uv[:, 0]).astype(np.int64), np.floor(sample_uv[:, 1]).astype(np.int64)
+        inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+        np.minimum.at(zbuf, row[inside]*width + col[inside], sample_depth[inside])
+    return zbuf.reshape(height, width)
+
+def dilate_zbuffer(zbuf, radius=1):
+    # farthest surface within radius cells (empty cells ignored): a surface seen at a grazing angle
+    # spans a large depth range within one cell, its points must not be hidden by the cell minimum
+    if radius == 0:
+        return zbuf
+    height, width = zbuf.shape
+    padded = np.pad(np.where(np.isinf(zbuf), -np.inf, zbuf), radius, mode='edge')
+    dilated = np.full_like(zbuf, -np.inf)
+    for dy in range(2*radius + 1):
+        for dx in range(2*radius + 1):
+            np.maximum(dilated, padded[dy:dy + height, dx:dx + width], out=dilated)
+    return np.where(np.isinf(zbuf), np.inf, dilated)
+
+def get_unoccluded(uv, depth, zbuf, scale=1.0, depth_tol=0.01):
+    # points (... x 2 pixel coordinates, ... depth) no farther than depth_tol (relative) behind the z-buffer
+    height, width = zbuf.shape
+    col = np.clip(np.floor(uv[..., 0] * scale), 0, width - 1).astype(np.int64)
+    row = np.clip(np.floor(uv[..., 1] * scale), 0, height - 1).astype(np.int64)
+    with np.errstate(invalid='ignore'):
+        return depth <= zbuf[row, col] * (1 + depth_tol)
+
+# ----------------------------------------------------------
+def project_trajectory(K, RT, points, width, height, occluder=None, zbuffer_scale=0.25, depth_tol=0.01, \
+                       dilate=1, near=1e-6, chunk_size=16):
+    # Dense projection of V points into N cameras:
+    #   'uv' N x V x 2 float32 pixel coordinates, 'depth' N x V float32,
+    #   'in_frustum' N x V bool, 'visible' N x V bool (in frustum and not occluded)
+    # occluder: (vertices, faces) triangle mesh for the occlusion test, e.g. the model itself
+    #   (None: visible = in_frustum); zbuffer_scale: z-buffer resolution relative to the image
+    # dilate: z-buffer cells around a point it is compared with, see dilate_zbuffer
+    # chunk_size: cameras projected at once, bounds the float64 temporaries
+    RT = np.asarray(RT, dtype=np.float64)
+    RT = RT.reshape(-1, RT.shape[-2], 4)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    cam_num, point_num = len(RT), len(points)
+    result = {'uv': np.empty((cam_num, point_num, 2), np.float32), 'depth': np.empty((cam_num, point_num), np.float32), \
+              'in_frustum': np.empty((cam_num, point_num), bool), 'visible': np.empty((cam_num, point_num), bool)}
+    zbuf_width, zbuf_height = max(int(round(width * zbuffer_scale)), 1), max(int(round(height * zbuffer_scale)), 1)
+    for start in range(0, cam_num, chunk_size):
+        end = min(start + chunk_size, cam_num)
+        uv, depth = project_points(K, RT[start:end], points)
+        in_frustum = get_in_frustum(uv, depth, width, height, near)
+        result['uv'][start:end] = uv
+        result['depth'][start:end] = depth
+        result['in_frustum'][start:end] = in_frustum
+        if occluder is None:
+            result['visible'][start:end] = in_frustum
+            continue
+        occ_uv, occ_depth = project_points(K, RT[start:end], occluder[0])
+        for k in range(end - start):
+            zbuf = render_zbuffer(occ_uv[k] * zbuffer_scale, occ_depth[k], occluder[1], zbuf_width, zbuf_height, near)
+            zbuf = dilate_zbuffer(zbuf, dilate)
+            result['visible'][start + k] = in_frustum[k] & get_unoccluded(uv[k], depth[k], zbuf, zbuffer_scale, depth_tol)
+    return result
+
+def save_visibility(filepath, frame_ids, result):
+    # .npz with the frame index of each camera row
+    np.savez(filepath, frame_ids=np.asarray(frame_ids), **result)
+
+def load_visibility(filepath):
+    data = np.load(filepath)
+    return {key: data[key] for key in data.files}
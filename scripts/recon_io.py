@@ -0,0 +1,93 @@
+import os
+import re
+import glob
+import numpy as np
+from geom_helpers import RcC_from_RT, tum_from_matrices
+
+# Reading of reconstructed camera files and TUM trajectory files, pure numpy.
+# model-N-cams.txt (one file per reconstructed model of the sfm results) holds the number of
+# cameras on the first line, then per camera a 3 x 4 world to cv camera transform [R|t]
+# whose first row is prefixed with the frame index:
+#   frame r00 r01 r02 t0
+#   r10 r11 r12 t1
+#   r20 r21 r22 t2
+# that is 13 numbers per camera, read in one pass as one token array.
+
+CAMS_FILE_RE = re.compile(r'model-(\d+)-cams\.txt$')
+
+# ----------------------------------------------------------
+def read_cams_file(filepath):
+    # -> frame indices N (int64), world to cv camera transforms N x 3 x 4
+    file = open(filepath, "r")
+    tokens = np.array(file.read().split(), dtype=np.float64)
+    file.close()
+    if len(tokens) == 0:
+        return np.empty(0, np.int64), np.empty((0, 3, 4))
+    num = int(tokens[0])
+    if len(tokens) - 1 < num * 13:
+        raise ValueError(filepath + ': ' + str(num) + ' cameras declared, ' + str((len(tokens) - 1) // 13) + ' found')
+    rows = tokens[1:1 + num*13].reshape(num, 13)
+    return rows[:, 0].astype(np.int64), rows[:, 1:].reshape(num, 3, 4)
+
+def get_tum_from_RT(frame_ids, RT, negate_x=False):
+    # N x 8 TUM rows of the camera poses (Blender camera axes), sorted by frame index
+    tum = tum_from_matrices(frame_ids, RcC_from_RT(RT))
+    if negate_x: # x of the position mirrored, see evo_eval.ipynb
+        tum[:, 1] = -tum[:, 1]
+    return tum[np.argsort(tum[:, 0], kind='stable')]
+
+def read_cams_file_as_tum(filepath, negate_x=False):
+    return get_tum_from_RT(*read_cams_file(filepath), negate_x=negate_x)
+
+def get_tum_filepath(cams_filepath):
+    # model-N-cams.txt -> model-N-cams_wmat_tq.txt
+    return os.path.splitext(cams_filepath)[0] + '_wmat_tq.txt'
+
+def get_reconstructed_traj_file(source, dest=None, negate_x=False):
+    # model-N-cams.txt -> TUM trajectory file; dest: file path, folder or None (next to source)
+    if dest is None or os.path.isdir(dest):
+        dest = get_tum_filepath(source) if dest is None else os.path.join(dest, os.path.basename(get_tum_filepath(source)))
+    tum = read_cams_file_as_tum(source, negate_x)
+    write_tum(dest, tum)
+    return tum
+
+# ----------------------------------------------------------
+def find_cams_files(results_dir):
+    # {model index: path} of the model-N-cams.txt files of an sfm results folder
+    cams_files = {}
+    for filepath in glob.glob(os.path.join(results_dir, 'model-*-cams.txt')):
+        match = CAMS_FILE_RE.search(os.path.basename(filepath))
+        if match:
+            cams_files[int(match.group(1))] = filepath
+    return dict(sorted(cams_files.items()))
+
+def read_cams_files(results_dir, negate_x=False):
+    # {model index: N x 8 TUM rows} of all reconstructed models
+    return {model: read_cams_file_as_tum(filepath, negate_x) for model, filepath in find_cams_files(results_dir).items()}
+
+def convert_cams_files(results_dir, negate_x=False):
+    # writes model-N-cams_wmat_tq.txt for every model, returns {model index: camera number}
+    counts = {}
+    for model, filepath in find_cams_files(results_dir).items():
+        counts[model] = len(get_reconstructed_traj_file(filepath, negate_x=negate_x))
+    return counts
+
+def get_largest_model(results_dir):
+    # index of the model with the most cameras, None if there is none
+    counts = {model: get_cams_count(filepath) for model, filepath in find_cams_files(results_dir).items()}
+    return max(counts, key=counts.get) if counts else None
+
+def get_cams_count(filepath):
+    # camera number from the first line only
+    file = open(filepath, "r")
+    line = file.readline()
+    file.close()
+    return int(line) if line.strip() else 0
+
+# ----------------------------------------------------------
+def read_tum(filepath):
+    # N x 8 (timestamp tx ty tz qx qy qz qw), comment lines starting with # are skipped
+    return np.loadtxt(filepath, dtype=np.float64, comments='#', ndmin=2).reshape(-1, 8)
+
+def write_tum(filepath, tum, fmt='%.5f'):
+    np.savetxt(filepath, np.asarray(tum).reshape(-1, 8), fmt=fmt)
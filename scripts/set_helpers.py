@@ -31,6 +31,26 @@ def set_cam_trajectory(curve_id, delta_scale):
     follow_constraint.influence = 1
 
 
+def set_cam_offset(cam, offset_factor):
+    cam.constraints["Follow Path"].offset_factor = offset_factor
+
+def get_frame_offset(frame, frame_num, frame_offsets=None):
+    # offset_factor of a frame: uniform in offset_factor, or from a table (e.g. constant arc length step, see traj_helpers.py)
+    if frame_offsets is None:
+        return frame * 1.0/frame_num
+    return float(frame_offsets[frame])
+
+def get_deform_value(frame, frame_num, deform_max, deform_cycle):
+    # sawtooth shape key value, repeats deform_cycle times over the trajectory
+    return frame%int(frame_num/deform_cycle) * 1.0/(frame_num/deform_cycle) * deform_max
+
+def set_deform(model, apply_deform, value=0):
+    if not apply_deform:
+        model.active_shape_key_index = 0
+    else:
+        model.active_shape_key_index = 1
+        model.active_shape_key.value = value
+
 def set_model(obj_id):
     model = bpy.data.objects[obj_id]
     set_hide_render([model], hide=False)
@@ -43,3 +63,87 @@ def set_model(obj_id):
     track_constraint.target_space = 'WORLD'
     track_constraint.owner_space = 'WORLD'
     track_constraint.influence = 1
+
+# ----------------------------------------------------------
+# Extra outputs of the same render, written by compositor File Output nodes:
+#   grid: second view layer that renders the same model with the material of grid_model_id
+#         (material override), so bladder and grid images share geometry, pose and deformation
+#   depth/normal: gt passes of the main view layer, as float EXR
+GRID_LAYER_ID = 'grid'
+MULTI_OUTPUT_PREFIX = 'EVS '
+PASS_SOCKETS = {'depth': 'Depth', 'normal': 'Normal'}
+PREV_PASSES_KEY = 'evs_prev_passes' # scene property with the pass settings of the view layer before set_multi_output
+
+def get_or_new_node(tree, name, type):
+    node = tree.nodes.get(name)
+    if node is None:
+        node = tree.nodes.new(type)
+        node.name = name
+    return node
+
+def new_file_output(tree, name, base_path, slot_path, file_format, color_mode, color_depth='8'):
+    out = get_or_new_node(tree, MULTI_OUTPUT_PREFIX + name, 'CompositorNodeOutputFile')
+    out.base_path = base_path
+    out.file_slots[0].path = slot_path # '#' is replaced by the frame number, see scene.frame_current
+    out.format.file_format = file_format
+    out.format.color_mode = color_mode
+    out.format.color_depth = color_depth
+    return out
+
+def set_multi_output(scene, data_folder, grid_model_id=None, grid_frame_fd='raw_grid', passes=(), grid_samples=0):
+    # grid_samples: samples of the grid view layer, 0 uses the scene samples
+    tree = scene.node_tree
+    main_layers = tree.nodes['Render Layers']
+    main_lens = tree.nodes['Lens Distortion']
+    if grid_model_id is not None:
+        if GRID_LAYER_ID not in scene.view_layers:
+            scene.view_layers.new(GRID_LAYER_ID)
+        grid_layer = scene.view_layers[GRID_LAYER_ID]
+        grid_layer.use = True
+        grid_layer.samples = grid_samples
+        grid_layer.material_override = bpy.data.objects[grid_model_id].active_material
+        grid_layers = get_or_new_node(tree, MULTI_OUTPUT_PREFIX + 'Grid Render Layers', 'CompositorNodeRLayers')
+        grid_layers.layer = GRID_LAYER_ID
+        grid_lens = get_or_new_node(tree, MULTI_OUTPUT_PREFIX + 'Grid Lens Distortion', 'CompositorNodeLensdist')
+        grid_lens.use_fit = main_lens.use_fit
+        grid_lens.use_jitter = main_lens.use_jitter
+        grid_lens.use_projector = main_lens.use_projector
+        grid_lens.inputs[1].default_value = main_lens.inputs[1].default_value
+        grid_lens.inputs[2].default_value = main_lens.inputs[2].default_value
+        settings = scene.render.image_settings
+        grid_out = new_file_output(tree, 'Grid File Output', data_folder + '/' + grid_frame_fd + '/', 'cysto_######', \
+                                   settings.file_format, settings.color_mode)
+        tree.links.new(grid_layers.outputs['Image'], grid_lens.inputs['Image'])
+        tree.links.new(grid_lens.outputs['Image'], grid_out.inputs[0])
+    view_layer = scene.view_layers[main_layers.layer]
+    if PREV_PASSES_KEY not in scene: # restored by unset_multi_output
+        scene[PREV_PASSES_KEY] = {'layer': view_layer.name, 'use_pass_z': view_layer.use_pass_z, \
+                                  'use_pass_normal': view_layer.use_pass_normal}
+    view_layer.use_pass_z = 'depth' in passes
+    view_layer.use_pass_normal = 'normal' in passes
+    for name in passes: # undistorted, in the frame of the camera before the lens distortion node
+        out = new_file_output(tree, name.capitalize() + ' File Output', data_folder + '/raw_' + name + '/', \
+                              name + '_######', 'OPEN_EXR', 'BW' if name == 'depth' else 'RGB', '32')
+        tree.links.new(main_layers.outputs[PASS_SOCKETS[name]], out.inputs[0])
+
+def unset_multi_output(scene):
+    tree = scene.node_tree
+    for node in [node for node in tree.nodes if node.name.startswith(MULTI_OUTPUT_PREFIX)]:
+        tree.nodes.remove(node)
+    if GRID_LAYER_ID in scene.view_layers:
+        scene.view_layers[GRID_LAYER_ID].use = False
+    if PREV_PASSES_KEY in scene:
+        prev = scene[PREV_PASSES_KEY]
+        if prev['layer'] in scene.view_layers:
+            scene.view_layers[prev['layer']].use_pass_z = bool(prev['use_pass_z'])
+            scene.view_layers[prev['layer']].use_pass_normal = bool(prev['use_pass_normal'])
+        del scene[PREV_PASSES_KEY]
+
+def get_multi_output_files(scene, data_folder, frame_id, grid_model_id=None, grid_frame_fd='raw_grid', passes=()):
+    # files set_multi_output writes for a frame (scene.frame_current = frame_id)
+    filepaths = []
+    if grid_model_id is not None:
+        filepaths.append(data_folder + '/' + grid_frame_fd + '/cysto_' + format(frame_id, '06d') + scene.render.file_extension)
+    for name in passes:
+        filepaths.append(data_folder + '/raw_' + name + '/' + name + '_' + format(frame_id, '06d') + '.exr')
+    return filepaths
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+
+# Sharded rendering: split the frame range of one scan_and_render job across several
+# headless Blender processes, e.g.
+#   python shard_render.py job.json --blend ../EVS.blend --shards 8
+# where job.json holds the keyword arguments of main.scan_and_render.
+# Each worker renders a disjoint slice of offset_factor values and writes its own piece
+# of the gt trajectory, which is merged into one file sorted by frame at the end.
+# What must be the same in every shard (frame_num of a step_mm job, the profile picked by
+# render_profile 'AUTO') is resolved once by a setup process before the workers start, which
+# also configures base_data (data_config.json, ...) like a serial run with save_video.
+
+SHARD_FD = 'shards'
+
+def split_frames(frame_num, shard_num, frame_ids=None):
+    # contiguous, disjoint slices of the frame range (or of the frame_ids subset of the job)
+    frame_ids = np.arange(frame_num) if frame_ids is None else np.asarray(frame_ids, dtype=np.int64)
+    return [ids.tolist() for ids in np.array_split(frame_ids, shard_num)]
+
+def get_shard_traj_file(shard_id, traj_file='cam_wmat_tq_gt.txt'):
+    name, ext = os.path.splitext(traj_file)
+    return SHARD_FD + '/' + name + '_shard' + format(shard_id, '02d') + ext
+
+def get_shard_manifest_file(shard_id, frame_fd):
+    return SHARD_FD + '/' + frame_fd + '_manifest_shard' + format(shard_id, '02d') + '.json'
+
+def get_shard_stats_prefix(shard_id, frame_fd):
+    # writer stats and profile files of a shard
+    return SHARD_FD + '/' + frame_fd + '_shard' + format(shard_id, '02d')
+
+def needs_base_data(job):
+    # data_config.json, frame_ranges_and_selection.json, camera_params.json, as scan_and_render writes them
+    return job.get('save_video', False) and job.get('template_folder') is not None
+
+def needs_setup(job):
+    return job.get('step_mm') is not None or job.get('render_profile') == 'AUTO' or needs_base_data(job)
+
+def merge_shard_trajs(data_folder, shard_num, traj_file='cam_wmat_tq_gt.txt'):
+    pieces = []
+    for k in range(shard_num):
+        fp = data_folder + '/' + get_shard_traj_file(k, traj_file)
+        if not os.path.exists(fp):
+            raise SystemExit('Error: trajectory of shard ' + str(k) + ' doesn\'t exist!')
+        pieces.append(np.loadtxt(fp, ndmin=2))
+    traj = np.vstack(pieces)
+    traj = traj[np.argsort(traj[:, 0], kind='stable')]
+    np.savetxt(data_folder + '/' + traj_file, traj, fmt='%.5f')
+    from gt_store import get_gt_store_dir, merge_gt_stores
+    merge_gt_stores(data_folder + '/' + get_gt_store_dir(traj_file), \
+                    [data_folder + '/' + get_gt_store_dir(get_shard_traj_file(k, traj_file)) for k in range(shard_num)]).close()
+    return traj
+
+def launch_shards(job, blend_file, shard_num, blender_bin='blender', threads_per_shard=None, serial_time=None):
+    data_folder = job['data_folder']
+    shard_dir = data_folder + '/' + SHARD_FD
+    for fd in [shard_dir, data_folder + '/' + job['frame_fd']]: # created once here, not raced by the workers
+        if not os.path.exists(fd):
+            os.makedirs(fd)
+    if threads_per_shard is None: # share the cores instead of letting every worker grab all of them
+        threads_per_shard = max(1, (os.cpu_count() or 1) // shard_num)
+    job_fp = shard_dir + '/job.json'
+    write_job(job_fp, dict({'render_threads': threads_per_shard}, **job))
+
+    t0 = time.time()
+    if needs_setup(job):
+        cmd = [blender_bin, '-b', blend_file, '-t', str(threads_per_shard), '--python', os.path.abspath(__file__), \
+               '--', job_fp, 'setup']
+        log = open(shard_dir + '/setup.log', "w")
+        code = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        if code != 0:
+            raise SystemExit('Error: shard setup failed, see ' + shard_dir + '/setup.log')
+        file = open(shard_dir + '/setup.json', "r")
+        setup = json.load(file)
+        file.close()
+        job = dict(job, frame_num=setup['frame_num'])
+        if job.get('render_profile') == 'AUTO': # the profile picked once, not autotuned again by every shard
+            job['render_profile'] = setup['render_profile']
+        write_job(job_fp, dict({'render_threads': threads_per_shard}, **job))
+    procs = []
+    for k in range(shard_num):
+        cmd = [blender_bin, '-b', blend_file, '-t', str(threads_per_shard), '--python', os.path.abspath(__file__), \
+               '--', job_fp, str(k), str(shard_num)]
+        log = open(shard_dir + '/shard' + format(k, '02d') + '.log', "w")
+        procs.append((subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), log))
+    failed = []
+    for k, (proc, log) in enumerate(procs):
+        if proc.wait() != 0:
+            failed.append(k)
+        log.close()
+    wall_time = time.time() - t0
+    if failed:
+        raise SystemExit('Error: shards ' + str(failed) + ' failed, see logs in ' + shard_dir)
+
+    if job.get('save_traj', False):
+        merge_shard_trajs(data_folder, shard_num, job.get('traj_file', 'cam_wmat_tq_gt.txt'))
+        export_shard_cameras(job, shard_dir)
+        if needs_base_data(job):
+            write_base_camera_params(job)
+    if job.get('save_video', False) and job.get('save_render', False):
+        from video_helpers import convert_frames2video
+        convert_frames2video(data_folder + '/' + job['frame_fd'] + '/', 'video_cysto.avi', frame_rate=10, \
+                             ext=get_shard_file_extension(shard_dir))
+    report = get_speedup_report(shard_dir, shard_num, wall_time, serial_time)
+    file = open(shard_dir + '/speedup.json', "w")
+    json.dump(report, file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+    print('Sharded rendering finished: ' + str(shard_num) + ' shards, wall ' + str(round(wall_time, 1)) + 's, speedup ' \
+          + str(round(report['speedup'], 2)) + 'x (' + report['serial_source'] + ' serial time)')
+    return report
+
+def write_job(job_fp, job):
+    file = open(job_fp, "w")
+    json.dump(job, file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+
+def get_shard_file_extension(shard_dir):
+    # extension of the rendered frames, reported by shard 0
+    file = open(shard_dir + '/shard00.json', "r")
+    ext = json.load(file)['file_extension']
+    file.close()
+    return ext
+
+def write_base_camera_params(job):
+    # camera_params.json with the intrinsics of the merged gt store, as configure_base_data_folder does for a serial run
+    from camera_export import write_camera_params_json
+    from gt_store import GTStore, get_gt_store_dir
+    store = GTStore(job['data_folder'] + '/' + get_gt_store_dir(job.get('traj_file', 'cam_wmat_tq_gt.txt')))
+    width, height = store.meta['resolution']
+    write_camera_params_json(job['data_folder'] + '/camera_params.json', store.K, width, height, \
+                             job['template_folder'] + '/camera_params.json')
+    store.close()
+
+def export_shard_cameras(job, shard_dir):
+    # once from the merged gt store, the workers don't export (see run_shard_worker)
+    from camera_export import EXPORT_FORMATS, export_cameras
+    from gt_store import get_gt_store_dir
+    formats = job.get('camera_formats', EXPORT_FORMATS)
+    if not formats:
+        return
+    ext = get_shard_file_extension(shard_dir)
+    template_folder = job.get('template_folder')
+    export_cameras(job['data_folder'] + '/' + get_gt_store_dir(job.get('traj_file', 'cam_wmat_tq_gt.txt')), \
+                   job['data_folder'] + '/cameras', formats, name_fmt='cysto_{:06d}' + ext, \
+                   json_template_fp=template_folder + '/camera_params.json' if template_folder is not None else None)
+
+def get_speedup_report(shard_dir, shard_num, wall_time, serial_time=None):
+    shard_times = []
+    for k in range(shard_num):
+        file = open(shard_dir + '/shard' + format(k, '02d') + '.json', "r")
+        shard_times.append(json.load(file)['elapsed'])
+        file.close()
+    # without a measured serial run, the serial path is estimated as the sum of per-shard work
+    serial_source = 'measured' if serial_time is not None else 'estimated'
+    if serial_time is None:
+        serial_time = sum(shard_times)
+    return {'shard_num': shard_num, 'wall_time': wall_time, 'shard_times': shard_times, \
+            'serial_time': serial_time, 'serial_source': serial_source, 'speedup': serial_time / wall_time}
+
+def import_main():
+    # inside a headless blender process
+    import bpy
+    dir = os.path.dirname(bpy.data.filepath) + '/scripts'
+    if not dir in sys.path:
+        sys.path.append(dir)
+    import main
+    return main
+
+def read_job(job_fp):
+    file = open(job_fp, "r")
+    job = json.load(file)
+    file.close()
+    return job
+
+def run_shard_setup(job_fp):
+    # scene set up as for the shards without rendering any frame: frame_num (step_mm) and
+    # the autotuned profile (<frame_fd>_autotune.json, reused on resume) to setup.json
+    main = import_main()
+    job = read_job(job_fp)
+    for key in ['frame_ids', 'traj_file', 'manifest_file']:
+        job.pop(key, None)
+    run_params = main.scan_and_render(frame_ids=[], manifest_file=SHARD_FD + '/' + job['frame_fd'] + '_manifest_setup.json', \
+                                      **dict(job, frame_num=job.get('frame_num'), save_traj=False, save_video=False, writer_threads=0, instrument=False, \
+                                             save_deform=False, camera_formats=()))
+    if needs_base_data(job): # camera_params.json gets the intrinsics of the merged gt store in launch_shards
+        main.configure_base_data_folder(job['data_folder'], job['template_folder'], cysto_frame_start=0, \
+                                        cysto_frame_end=run_params['frame_num'])
+    file = open(os.path.dirname(job_fp) + '/setup.json', "w")
+    json.dump({'frame_num': run_params['frame_num'], 'render_profile': run_params['render_profile']}, \
+              file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+
+def run_shard_worker(job_fp, shard_id, shard_num):
+    # runs inside a headless blender process
+    main = import_main()
+    import bpy
+    job = read_job(job_fp)
+    # set per shard below
+    traj_file = job.pop('traj_file', 'cam_wmat_tq_gt.txt')
+    job.pop('manifest_file', None)
+    frame_ids = split_frames(job['frame_num'], shard_num, job.pop('frame_ids', None))[shard_id]
+    job['save_video'] = False # frames of other shards are not there yet
+    job['save_deform'] = job.get('save_deform', False) and shard_id == 0 # one deformation cache for all shards
+    job['camera_formats'] = () # exported once from the merged gt store (see launch_shards)
+    t0 = time.time()
+    main.scan_and_render(frame_ids=frame_ids, traj_file=get_shard_traj_file(shard_id, traj_file), \
+                         manifest_file=get_shard_manifest_file(shard_id, job['frame_fd']), \
+                         stats_prefix=get_shard_stats_prefix(shard_id, job['frame_fd']), **job)
+    elapsed = time.time() - t0
+
+    file = open(os.path.dirname(job_fp) + '/shard' + format(shard_id, '02d') + '.json', "w")
+    json.dump({'frame_ids': frame_ids, 'elapsed': elapsed, 'file_extension': bpy.data.scenes['Scene'].render.file_extension}, \
+              file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+
+if __name__ == "__main__":
+    if '--' in sys.argv: # worker: blender -b EVS.blend --python shard_render.py -- job.json shard_id shard_num
+        args = sys.argv[sys.argv.index('--') + 1:]
+        if args[1] == 'setup': # blender -b EVS.blend --python shard_render.py -- job.json setup
+            run_shard_setup(args[0])
+        else:
+            run_shard_worker(args[0], int(args[1]), int(args[2]))
+    else:
+        import argparse
+        parser = argparse.ArgumentParser(description='Render one scan_and_render job in several blender processes.')
+        parser.add_argument('job', help='json file with scan_and_render arguments')
+        parser.add_argument('--blend', default=os.path.dirname(os.path.abspath(__file__)) + '/../EVS.blend')
+        parser.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--blender', default='blender', help='blender executable')
+        parser.add_argument('--threads', type=int, default=None, help='render threads per shard')
+        parser.add_argument('--serial_time', type=float, default=None, help='measured serial wall time in seconds')
+        args = parser.parse_args()
+        file = open(args.job, "r")
+        job = json.load(file)
+        file.close()
+        launch_shards(job, args.blend, args.shards, args.blender, args.threads, args.serial_time)
@@ -0,0 +1,180 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+from image_helpers import write_image, check_encoder
+
+# Frame sinks for render results captured as numpy arrays (see capture_helpers.py).
+# A sink gets every frame through write(frame_id, img), img being a HxWx4 float32 RGBA
+# view in scene linear color, top row first, which is only valid until the next frame
+# is rendered. close() is called by whoever created the sink.
+
+# ----------------------------------------------------------
+def linear_to_srgb8(img, channels=3, exposure=0.0, gamma=1.0):
+    # scene linear float -> 8-bit sRGB, matches the 'Standard' view transform (sRGB display, no look,
+    # no curves) with the scene's exposure and gamma, see capture_helpers.get_srgb8_settings
+    rgb = img[..., :channels] * 2.0**exposure if exposure != 0 else img[..., :channels]
+    rgb = np.clip(rgb, 0, 1)
+    srgb = np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * np.power(rgb, 1/2.4) - 0.055)
+    if gamma != 1:
+        srgb = np.power(srgb, 1/gamma)
+    return (srgb * 255 + 0.5).astype(np.uint8)
+
+# ----------------------------------------------------------
+class NpyStackSink:
+    # lossless: all frames in one memory-mapped N x H x W x C .npy file, uint8 sRGB or float32 linear
+    def __init__(self, filepath, frame_num, height, width, channels=3, dtype=np.uint8):
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        self.frames = np.lib.format.open_memmap(filepath, mode='w+', dtype=self.dtype, \
+                                                shape=(frame_num, height, width, channels))
+
+    def write(self, frame_id, img):
+        if self.dtype == np.uint8:
+            self.frames[frame_id] = linear_to_srgb8(img, self.channels)
+        else:
+            self.frames[frame_id] = img[..., :self.channels]
+
+    def close(self):
+        self.frames.flush()
+        del self.frames
+
+class AsyncFrameWriter:
+    # Encodes and saves frames in a pool of writer threads while the next frame renders.
+    # filepath_fmt: e.g. '/data/raw_cysto/cysto_{:06d}.png', the extension picks the format
+    # (.png, .jpg, .exr float linear, .npy float linear). write() blocks only when
+    # queue_size frames are already waiting; that stall time is counted.
+    # .jpg/.exr need OpenCV or imageio (image_helpers.has_encoder); quality: JPEG quality, e.g. the
+    # scene's image_settings.quality; exposure, gamma: those of the scene's view settings
+    def __init__(self, filepath_fmt, thread_num=4, queue_size=8, quality=95, exposure=0.0, gamma=1.0):
+        self.filepath_fmt = filepath_fmt
+        self.ext = os.path.splitext(filepath_fmt)[1].lower()
+        check_encoder(self.ext)
+        self.quality = quality
+        self.exposure = exposure
+        self.gamma = gamma
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.errors = []
+        self.stats = {'frames': 0, 'stall_time': 0.0, 'stalls': 0, 'write_time': 0.0, \
+                      'queue_depth_max': 0, 'queue_depth_sum': 0}
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(thread_num)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            frame_id, img = item
+            t0 = time.time()
+            try:
+                if self.ext not in ['.exr', '.npy']: # sRGB conversion off the render thread too
+                    img = linear_to_srgb8(img, 3, self.exposure, self.gamma)
+                write_image(self.filepath_fmt.format(frame_id), img, self.quality)
+            except Exception as e:
+                self.errors.append((frame_id, e))
+            with self.lock:
+                self.stats['write_time'] += time.time() - t0
+            self.queue.task_done()
+
+    def write(self, frame_id, img):
+        if self.errors:
+            raise self.errors[0][1]
+        # only copied in the caller (the captured buffer is reused by the next render), queued frames are float32
+        img = img[..., :3].copy()
+        depth = self.queue.qsize()
+        self.stats['queue_depth_max'] = max(self.stats['queue_depth_max'], depth)
+        self.stats['queue_depth_sum'] += depth
+        t0 = time.time()
+        try:
+            self.queue.put_nowait((frame_id, img))
+        except queue.Full:
+            self.queue.put((frame_id, img))
+            self.stats['stalls'] += 1
+            self.stats['stall_time'] += time.time() - t0
+        self.stats['frames'] += 1
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['queue_depth_mean'] = stats['queue_depth_sum'] / max(stats['frames'], 1)
+        stats['thread_num'] = len(self.threads)
+        stats['queue_size'] = self.queue.maxsize
+        return stats
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0][1]
+
+class VideoSink:
+    # feeds an ffmpeg writer (video_helpers.FFmpegWriter with input_codec='rawvideo') without any image files
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, frame_id, img):
+        self.writer.add_frame_array(np.ascontiguousarray(linear_to_srgb8(img)))
+
+    def close(self):
+        self.writer.close()
+
+# ----------------------------------------------------------
+# Ring of the latest frames in a memory-mapped file (e.g. in /dev/shm) for a live consumer
+# in another process. Layout: int64 header [magic, slot_num, height, width, channels,
+# write_count], int64 frame id per slot, then slot_num uint8 sRGB frames.
+RING_MAGIC = 0x45565352 # 'EVSR'
+RING_HEADER_LEN = 6
+
+def _open_ring(filepath, mode, slot_num=None, height=None, width=None, channels=None):
+    if mode == 'w+':
+        header = np.array([RING_MAGIC, slot_num, height, width, channels, 0], np.int64)
+    else:
+        header = np.fromfile(filepath, np.int64, RING_HEADER_LEN)
+        if header[0] != RING_MAGIC:
+            raise ValueError('Not a frame ring file: ' + filepath)
+        slot_num, height, width, channels = [int(_) for _ in header[1:5]]
+    head_bytes = (RING_HEADER_LEN + slot_num) * 8
+    buffer = np.memmap(filepath, dtype=np.uint8, mode=mode, shape=(head_bytes + slot_num*height*width*channels,))
+    head = buffer[:head_bytes].view(np.int64)
+    if mode == 'w+':
+        head[:RING_HEADER_LEN] = header
+        head[RING_HEADER_LEN:] = -1
+    slots = buffer[head_bytes:].reshape(slot_num, height, width, channels)
+    return buffer, head, slots
+
+class RingBufferSink:
+    def __init__(self, filepath, height, width, channels=3, slot_num=8):
+        self.channels = channels
+        self.buffer, self.head, self.slots = _open_ring(filepath, 'w+', slot_num, height, width, channels)
+
+    def write(self, frame_id, img):
+        count = int(self.head[5])
+        slot = count % len(self.slots)
+        self.slots[slot] = linear_to_srgb8(img, self.channels)
+        self.head[RING_HEADER_LEN + slot] = frame_id
+        self.head[5] = count + 1 # publish the frame last
+
+    def close(self):
+        self.buffer.flush()
+
+class RingBufferReader:
+    def __init__(self, filepath):
+        self.buffer, self.head, self.slots = _open_ring(filepath, 'r')
+
+    def get_write_count(self):
+        return int(self.head[5])
+
+    def read_latest(self):
+        # (frame_id, copy of the frame), or None before the first frame; single producer,
+        # a reader falling more than slot_num frames behind sees newer frames in old slots
+        count = self.get_write_count()
+        if count == 0:
+            return None
+        slot = (count - 1) % len(self.slots)
+        return int(self.head[RING_HEADER_LEN + slot]), self.slots[slot].copy()
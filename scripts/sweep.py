@@ -0,0 +1,99 @@
+import bpy
+import sys
+import os
+import json
+import time
+import itertools
+import importlib
+
+dir = os.path.dirname(bpy.data.filepath) + '/scripts'
+if not dir in sys.path:
+    sys.path.append(dir)
+import main, init_helpers, set_helpers
+importlib.reload(main)
+importlib.reload(init_helpers)
+importlib.reload(set_helpers)
+from set_helpers import set_hide_render, set_hide_viewport
+
+# Sweep runner: render a list of scan_and_render jobs in one Blender session, e.g.
+#   blender -b EVS.blend --python scripts/sweep.py -- sweep.json
+# sweep.json holds "data_root" and either a "jobs" list or an "axes" grid, e.g.
+#   {"data_root": "/data", "axes": {"model_id": ["bladder_sphere", "grid_sphere"], "traj_scale": [1.0, 2.0]}}
+# A job with "step_mm" gets frames at a constant distance along its trajectory instead.
+# The scene is initialized once and jobs are ordered so that the scene state changes
+# as little as possible between consecutive jobs.
+
+# scene state of a job, ordered from the most to the least expensive to change
+STATE_KEYS = ['model_id', 'traj_id', 'traj_scale', 'light_id', 'apply_deform', 'deform_max', 'deform_cycle', 'lens_distortion']
+JOB_DEFAULTS = {'traj_id': 'Sine_sphere_turn10', 'traj_scale': 1.0, 'light_id': 'Point', 'apply_deform': False, \
+                'deform_max': 1.0, 'deform_cycle': 3, 'lens_distortion': 0}
+FOLDER_FMT = '{model_id}_{traj_id}_s{traj_scale}_def{apply_deform:d}m{deform_max}c{deform_cycle}_dis{lens_distortion}_{light_id}'
+
+def make_job_grid(**axes):
+    keys = list(axes.keys())
+    return [dict(JOB_DEFAULTS, **dict(zip(keys, values))) for values in itertools.product(*[axes[key] for key in keys])]
+
+def order_jobs(jobs):
+    # lexicographic order on the state keys: the expensive changes (model, trajectory) happen once per group
+    jobs = [dict(JOB_DEFAULTS, **job) for job in jobs]
+    return sorted(jobs, key=lambda job: tuple(str(job[key]) for key in STATE_KEYS))
+
+def count_state_changes(jobs):
+    return sum(job_a[key] != job_b[key] for job_a, job_b in zip(jobs[:-1], jobs[1:]) for key in STATE_KEYS)
+
+def hide_unused_objects(prev_job, job):
+    # only objects of the previous job that the next job doesn't use, instead of resetting every object
+    unused = [bpy.data.objects[prev_job[key]] for key in ['model_id', 'traj_id', 'light_id'] if prev_job[key] != job[key]]
+    set_hide_render(unused)
+    set_hide_viewport(unused)
+
+def get_job_frame_num(job):
+    # None when the job has a step_mm, scan_and_render derives it from the curve length
+    if job.get('step_mm') is not None:
+        return None
+    if 'frame_num' in job:
+        return job['frame_num']
+    return int(round(job['traj_scale']*main.calc_frame_num_wconstspeed(job['traj_id'])))
+
+def run_sweep(jobs, data_root, folder_fmt=FOLDER_FMT, frame_fd='raw_cysto', render_mode='RENDER', \
+              save_render=True, save_traj=True, save_video=False, resume=False, render_profile=None, target_spf=None, \
+              render_threads=None, template_folder=None):
+    jobs = order_jobs(jobs)
+    print('Sweep of ' + str(len(jobs)) + ' jobs, ' + str(count_state_changes(jobs)) + ' scene state changes')
+    t0 = time.time()
+    init_helpers.main()
+    set_hide_render(bpy.data.objects)
+    set_hide_viewport(bpy.data.objects)
+    init_time = time.time() - t0
+
+    job_times = []
+    prev_job = None
+    for job in jobs:
+        t0 = time.time()
+        if prev_job is not None:
+            hide_unused_objects(prev_job, job)
+        data_folder = data_root + '/' + job.get('folder', folder_fmt.format(**job)) + '/base_data'
+        main.scan_and_render(data_folder, job.get('frame_fd', frame_fd), get_job_frame_num(job), job['model_id'], \
+                             job['traj_id'], job['traj_scale'], job['light_id'], render_mode, job['lens_distortion'], \
+                             job['apply_deform'], job['deform_max'], job['deform_cycle'], \
+                             save_render=save_render, save_traj=save_traj, save_video=save_video, resume=resume, init=False, \
+                             render_profile=render_profile, target_spf=target_spf, \
+                             render_threads=render_threads, step_mm=job.get('step_mm'), \
+                             template_folder=template_folder)
+        job_times.append(time.time() - t0)
+        prev_job = job
+
+    log = {'init_time': init_time, 'jobs': [dict(job, time=t) for job, t in zip(jobs, job_times)]}
+    file = open(data_root + '/sweep_log.json', "w")
+    json.dump(log, file, sort_keys=True, indent=4, separators=(',', ': '))
+    file.close()
+    print('Sweep finished!')
+    return log
+
+if __name__ == "__main__":
+    # blender -b EVS.blend --python scripts/sweep.py -- sweep.json
+    file = open(sys.argv[sys.argv.index('--') + 1], "r")
+    config = json.load(file)
+    file.close()
+    jobs = config.pop('jobs') if 'jobs' in config else make_job_grid(**config.pop('axes'))
+    run_sweep(jobs, **config)
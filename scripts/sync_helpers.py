@@ -0,0 +1,75 @@
+import numpy as np
+from geom_helpers import matrices_from_tum
+
+# Association of gt and reconstructed trajectories by frame index, pure numpy. The first
+# column of cam_wmat_tq_gt.txt and model-N-cams_wmat_tq.txt is the frame index, so poses
+# are joined exactly on it (linear time, one lookup table) instead of by nearest timestamp.
+# Several reconstructed sub-models (model-0, model-1, ...) are associated in one call:
+#   labels    per gt frame, the model that registered it (-1 if none, the first model wins
+#             if several did)
+#   dropped   gt frame ids registered by no model
+#   segments  runs of consecutive gt frames registered by one model, (model, start, end)
+#             gt rows with end exclusive, e.g. for per-segment metrics
+
+def get_frame_ids(tum):
+    # int64 frame ids of column 0, which must hold whole numbers
+    stamps = np.asarray(tum, dtype=np.float64).reshape(-1, 8)[:, 0]
+    frame_ids = np.rint(stamps).astype(np.int64)
+    if np.any(np.abs(stamps - frame_ids) > 1e-6) or np.any(frame_ids < 0):
+        raise ValueError('Trajectory timestamps are not frame indices')
+    return frame_ids
+
+def join_frame_ids(ref_ids, est_ids):
+    # (ref rows, est rows) of the frame ids in both, in the order of est_ids
+    ref_ids, est_ids = np.asarray(ref_ids, dtype=np.int64), np.asarray(est_ids, dtype=np.int64)
+    if len(ref_ids) == 0 or len(est_ids) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    lookup = np.full(max(ref_ids.max(), est_ids.max()) + 1, -1, np.int64)
+    lookup[ref_ids] = np.arange(len(ref_ids))
+    ref_rows = lookup[est_ids]
+    est_rows = np.flatnonzero(ref_rows >= 0)
+    return ref_rows[est_rows], est_rows
+
+def get_segments(labels):
+    # (label, start, end) runs of equal labels, without the -1 ones
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return []
+    starts = np.concatenate([[0], np.flatnonzero(labels[1:] != labels[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [len(labels)]])
+    return [(int(labels[s]), int(s), int(e)) for s, e in zip(starts, ends) if labels[s] != -1]
+
+def associate_models(tum_ref, tums_est):
+    # tums_est: {model index: N x 8 TUM rows} (see recon_io.read_cams_files) or one TUM array (model 0);
+    # gt rows are sorted by frame id first
+    if not isinstance(tums_est, dict):
+        tums_est = {0: tums_est}
+    ref_ids = get_frame_ids(tum_ref)
+    order = np.argsort(ref_ids, kind='stable')
+    ref_ids = ref_ids[order]
+    labels = np.full(len(ref_ids), -1, np.int64)
+    pairs = {}
+    for model, tum_est in tums_est.items():
+        ref_rows, est_rows = join_frame_ids(ref_ids, get_frame_ids(tum_est))
+        pairs[model] = (order[ref_rows], est_rows)
+        free = labels[ref_rows] == -1
+        labels[ref_rows[free]] = model
+    return {'frame_ids': ref_ids, 'pairs': pairs, 'labels': labels, 'registered': labels != -1, \
+            'dropped': ref_ids[labels == -1], 'segments': get_segments(labels)}
+
+def get_matched_matrices(tum_ref, tum_est, ref_rows, est_rows):
+    # gt and estimated N x 4 x 4 poses of the matched rows, sorted by frame id
+    order = np.argsort(tum_ref[ref_rows, 0], kind='stable')
+    _, M_ref = matrices_from_tum(tum_ref[ref_rows[order]])
+    _, M_est = matrices_from_tum(tum_est[est_rows[order]])
+    return M_ref, M_est
+
+# ----------------------------------------------------------
+def get_association_summary(association):
+    # counts of the association, e.g. for the summary csv
+    frame_num = len(association['frame_ids'])
+    registered = int(np.count_nonzero(association['registered']))
+    return {'frame_num': frame_num, 'registered': registered, 'dropped': frame_num - registered, \
+            'registered_fraction': registered / frame_num if frame_num else 0.0, \
+            'segment_num': len(association['segments']), \
+            'models': {int(model): int(len(rows[0])) for model, rows in association['pairs'].items()}}
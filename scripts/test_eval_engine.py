@@ -0,0 +1,40 @@
+import os
+import eval_engine
+
+# python -m pytest test_eval_engine.py
+
+def make_experiment(root, name):
+    ex_dir = str(root / name)
+    os.makedirs(ex_dir + '/base_experiment')
+    file = open(ex_dir + eval_engine.RECON_RESULTS, "w")
+    file.write('{}')
+    file.close()
+    return ex_dir
+
+def test_evaluate_summary_twice(tmp_path, monkeypatch):
+    # the second, incremental run writes string results into the columns of the first one
+    calls = []
+    def evaluate_experiment(ex_dir, mlp_fp=None, tolerances=eval_engine.TOLERANCES):
+        calls.append(ex_dir)
+        return {'cysto_len': '12.5', 'ind_largest': str(len(calls)), 'ape_T': '0.00123'}
+    monkeypatch.setattr(eval_engine, 'evaluate_experiment', evaluate_experiment)
+    ex_a, ex_b = make_experiment(tmp_path, 'a'), make_experiment(tmp_path, 'b')
+    csv_fp = str(tmp_path / 'experiment_summary.csv')
+    file = open(csv_fp, "w")
+    file.write('ex_dir,note\n' + ex_a + ',1\n' + ex_b + ',2\n')
+    file.close()
+
+    summ = eval_engine.evaluate_summary(csv_fp, process_num=1)
+    assert sorted(calls) == [ex_a, ex_b]
+    assert summ.loc[ex_a, 'cysto_len'] == '12.5'
+
+    file = open(ex_b + eval_engine.RECON_RESULTS, "w") # changed, evaluated again
+    file.write('{"changed": 1}')
+    file.close()
+    summ = eval_engine.evaluate_summary(csv_fp, process_num=1)
+    assert calls[2:] == [ex_b]
+    assert summ.loc[ex_b, 'ind_largest'] == '3'
+    assert summ.loc[ex_a, 'note'] == '1'
+
+    summ = eval_engine.evaluate_summary(csv_fp, process_num=1)
+    assert len(calls) == 3
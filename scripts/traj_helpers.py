@@ -0,0 +1,57 @@
+import os
+import numpy as np
+
+# Arc-length parameterization of camera trajectories, pure numpy. The Follow Path
+# offset_factor is not proportional to the distance travelled along the curve, so frames
+# spaced uniformly in offset_factor are denser on some stretches than on others. A table
+# of (offset_factor, arc length) from densely sampled camera positions gives the offsets
+# of frames at a constant physical step instead. Tables are cached per curve and scale
+# in .npz files.
+
+# ----------------------------------------------------------
+def get_arc_length_table(positions):
+    # positions: M x 3 camera positions at increasing offsets -> cumulative arc length M (0 at the first)
+    seg = np.linalg.norm(np.diff(np.asarray(positions, dtype=np.float64), axis=0), axis=1)
+    return np.concatenate([[0.0], np.cumsum(seg)])
+
+def get_offsets_at_lengths(offsets, lengths, s):
+    # inverse of the table: offset_factor at arc lengths s (piecewise linear)
+    return np.interp(s, lengths, offsets)
+
+def get_frame_num_from_step(total_length, step):
+    return max(int(round(total_length / step)), 1)
+
+def get_frame_offsets(offsets, lengths, frame_num):
+    # offset_factor of frames 0..frame_num-1 at a constant arc length step, the
+    # arc-length counterpart of i/frame_num
+    return get_offsets_at_lengths(offsets, lengths, np.arange(frame_num) * lengths[-1] / frame_num)
+
+def get_step_stats(positions):
+    # spacing of consecutive frames: min/mean/max step and max/min ratio
+    steps = np.diff(get_arc_length_table(positions))
+    return {'min': float(steps.min()), 'mean': float(steps.mean()), 'max': float(steps.max()), \
+            'ratio': float(steps.max() / max(steps.min(), 1e-300))}
+
+# ----------------------------------------------------------
+def get_arc_length_cache_file(cache_dir, traj_id, traj_scale, sample_num):
+    return os.path.join(cache_dir, 'arclen_' + traj_id + '_s' + format(traj_scale, 'g') + '_n' + str(sample_num) + '.npz')
+
+def load_arc_length_table(cache_fp, curve_hash):
+    # (offsets, lengths) or None if missing or computed for another curve geometry
+    if not os.path.exists(cache_fp):
+        return None
+    data = np.load(cache_fp)
+    if str(data['curve_hash']) != curve_hash:
+        return None
+    return data['offsets'], data['lengths']
+
+def save_arc_length_table(cache_fp, curve_hash, offsets, lengths):
+    # temp file first, concurrent shard workers never read a partial table
+    cache_dir = os.path.dirname(cache_fp)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_fp = cache_fp + '.' + str(os.getpid()) + '.tmp'
+    file = open(tmp_fp, "wb")
+    np.savez(file, curve_hash=np.array(curve_hash), offsets=offsets, lengths=lengths)
+    file.close()
+    os.replace(tmp_fp, cache_fp)
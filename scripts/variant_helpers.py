@@ -0,0 +1,165 @@
+import os
+import glob
+import json
+import numpy as np
+from multiprocessing import Pool
+from image_helpers import read_image, write_image
+from sink_helpers import linear_to_srgb8
+from distort_helpers import RemapTable, SRGB8_TO_LINEAR, distort_frames
+
+# Render once, derive many: datasets that differ only in image formation are derived from
+# one master sequence (rendered at high resolution with the widest FOV) instead of new
+# renders. A variant is a dict of the transforms to apply, in this order:
+#   'fov'             horizontal field of view in degrees, center crop of the master
+#   'size'            [width, height] of the output frames (after the crop)
+#   'lens_distortion' compositor lens distortion, see distort_helpers.py
+#   'vignetting'      0..1, blend towards cos^4 falloff of the field angle
+#   'read_noise'      std of gaussian noise, 'shot_noise' scale of signal dependent noise (linear color)
+#   'quality'         JPEG quality of the written frames
+# e.g. {'name': 'fov90_640', 'fov': 90, 'size': [640, 480], 'read_noise': 0.01, 'quality': 80}
+# Every variant folder gets variant.json with the variant and its intrinsics K.
+
+# ----------------------------------------------------------
+def get_crop_resize(K, width, height, fov=None, size=None):
+    # crop window (x0, y0, crop width, crop height in master pixels), output size and the adjusted K
+    K = np.asarray(K, dtype=np.float64)
+    crop_w, crop_h = float(width), float(height)
+    if fov is not None:
+        crop_w = min(2 * K[0, 0] * np.tan(np.radians(fov) / 2), width)
+        crop_h = crop_w * height / width if size is None else crop_w * size[1] / size[0]
+    out_w, out_h = (int(round(crop_w)), int(round(crop_h))) if size is None else (int(size[0]), int(size[1]))
+    x0, y0 = K[0, 2] - crop_w / 2, K[1, 2] - crop_h / 2
+    sx, sy = out_w / crop_w, out_h / crop_h
+    K_new = np.array([[K[0, 0]*sx, K[0, 1]*sx, (K[0, 2] - x0)*sx], [0, K[1, 1]*sy, (K[1, 2] - y0)*sy], [0, 0, 1]])
+    return (x0, y0, crop_w, crop_h), (out_w, out_h), K_new
+
+def get_crop_resize_map(crop, out_size):
+    # source pixel coordinates (pixel centers at integers) of the output pixels
+    x0, y0, crop_w, crop_h = crop
+    out_w, out_h = out_size
+    map_x = (np.arange(out_w) + 0.5) * crop_w / out_w + x0 - 0.5
+    map_y = (np.arange(out_h) + 0.5) * crop_h / out_h + y0 - 0.5
+    map_x, map_y = np.meshgrid(map_x, map_y)
+    return map_x, map_y
+
+def box_filter(img, radius):
+    # separable box blur (edge padded) against aliasing before downsampling, radius in pixels
+    if radius < 1:
+        return img
+    for axis in [0, 1]:
+        pad = [(0, 0)] * img.ndim
+        pad[axis] = (radius + 1, radius)
+        csum = np.cumsum(np.pad(img, pad, mode='edge'), axis=axis, dtype=np.float64)
+        n = img.shape[axis]
+        img = ((np.take(csum, np.arange(2*radius + 1, n + 2*radius + 1), axis=axis) \
+                - np.take(csum, np.arange(n), axis=axis)) / (2*radius + 1)).astype(np.float32)
+    return img
+
+def get_vignetting_gain(K, out_size, strength):
+    out_w, out_h = out_size
+    x, y = np.meshgrid(np.arange(out_w) + 0.5, np.arange(out_h) + 0.5)
+    tan2 = ((x - K[0, 2]) / K[0, 0])**2 + ((y - K[1, 2]) / K[1, 1])**2
+    cos4 = 1 / (1 + tan2)**2
+    return ((1 - strength) + strength * cos4).astype(np.float32)[..., None]
+
+# ----------------------------------------------------------
+class VariantTransform:
+    # the precomputed part (remap table, vignetting gain, K) of one variant for one master size
+    def __init__(self, variant, K, width, height):
+        self.variant = variant
+        crop, self.out_size, self.K = get_crop_resize(K, width, height, variant.get('fov'), variant.get('size'))
+        self.identity = crop == (0.0, 0.0, float(width), float(height)) and self.out_size == (width, height)
+        self.blur = int(crop[2] / self.out_size[0] / 2) # half the downsampling factor
+        self.table = None if self.identity else RemapTable(*get_crop_resize_map(crop, self.out_size), \
+                                                           np.ones(self.out_size[::-1], bool), (height, width))
+        self.gain = get_vignetting_gain(self.K, self.out_size, variant['vignetting']) if variant.get('vignetting') else None
+
+    def apply(self, img, seed=0):
+        # img: H x W x C uint8 sRGB master frame -> uint8 sRGB variant frame
+        channels = img.shape[-1]
+        linear = SRGB8_TO_LINEAR[img]
+        if not self.identity:
+            linear = self.table.apply(box_filter(linear, self.blur))
+        if self.variant.get('lens_distortion'):
+            linear = distort_frames(linear, self.variant['lens_distortion'], self.variant.get('fit', False))
+        if self.gain is not None:
+            linear = linear * self.gain
+        read_noise, shot_noise = self.variant.get('read_noise', 0), self.variant.get('shot_noise', 0)
+        if read_noise or shot_noise:
+            rng = np.random.default_rng(seed)
+            sigma = np.sqrt(read_noise**2 + shot_noise * np.maximum(linear, 0))
+            linear = linear + sigma * rng.standard_normal(linear.shape, dtype=np.float32)
+        return linear_to_srgb8(linear, channels)
+
+    def get_info(self):
+        return {'variant': self.variant, 'K': self.K.tolist(), 'width': self.out_size[0], 'height': self.out_size[1]}
+
+# ----------------------------------------------------------
+def get_variant_folder(dst_fmt, variant):
+    # dst_fmt: folder name with {} for the variant name, e.g. '/data/run_{}/base_data/raw_cysto'
+    return dst_fmt.format(variant['name'])
+
+_transforms = {}
+
+def _get_transforms(variants, K, width, height):
+    # per worker process, built on the first frame
+    key = (json.dumps(variants, sort_keys=True), width, height)
+    if key not in _transforms:
+        _transforms[key] = [VariantTransform(variant, K, width, height) for variant in variants]
+    return _transforms[key]
+
+def _make_variants_of_file(args):
+    src_fp, frame_id, dst_fmt, variants, K, ext = args
+    img = read_image(src_fp)[..., :3]
+    name = os.path.splitext(os.path.basename(src_fp))[0] + ext
+    for transform in _get_transforms(variants, K, img.shape[1], img.shape[0]):
+        write_image(os.path.join(get_variant_folder(dst_fmt, transform.variant), name), \
+                    transform.apply(img, seed=(transform.variant.get('seed', 0), frame_id)), \
+                    transform.variant.get('quality', 95))
+    return src_fp
+
+def make_variants(src_dir, dst_fmt, variants, K, src_ext='.png', ext='.jpg', process_num=None):
+    # every master frame of src_dir is read once and written once per variant, frames are spread over a
+    # pool of processes; K: intrinsics of the master (e.g. gt_store.GTStore(...).K)
+    src_fps = sorted(glob.glob(os.path.join(src_dir, '*' + src_ext)))
+    if not src_fps:
+        return 0
+    master = read_image(src_fps[0])
+    for transform in _get_transforms(variants, K, master.shape[1], master.shape[0]):
+        folder = get_variant_folder(dst_fmt, transform.variant)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        file = open(os.path.join(folder, 'variant.json'), "w")
+        json.dump(transform.get_info(), file, sort_keys=True, indent=4, separators=(',', ': '))
+        file.close()
+    jobs = [(src_fp, k, dst_fmt, variants, np.asarray(K).tolist(), ext) for k, src_fp in enumerate(src_fps)]
+    if process_num == 1:
+        for job in jobs:
+            _make_variants_of_file(job)
+    else:
+        pool = Pool(process_num)
+        for _ in pool.imap_unordered(_make_variants_of_file, jobs, chunksize=4):
+            pass
+        pool.close()
+        pool.join()
+    return len(src_fps)
+
+if __name__ == "__main__":
+    # python variant_helpers.py /data/master/base_data/raw_cysto '/data/{}/base_data/raw_cysto' variants.json
+    #   --gt /data/master/base_data/cam_wmat_tq_gt.gt
+    import argparse
+    parser = argparse.ArgumentParser(description='Derive datasets from a master rendering.')
+    parser.add_argument('src_dir', help='master frames')
+    parser.add_argument('dst_fmt', help='output folder, {} is replaced by the variant name')
+    parser.add_argument('variants', help='json file with a list of variants')
+    parser.add_argument('--gt', required=True, help='gt store of the master run (for K)')
+    parser.add_argument('--src_ext', default='.png')
+    parser.add_argument('--ext', default='.jpg')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    file = open(args.variants, "r")
+    variants = json.load(file)
+    file.close()
+    K = np.load(os.path.join(args.gt, 'K.npy'))
+    frame_num = make_variants(args.src_dir, args.dst_fmt, variants, K, args.src_ext, args.ext, args.processes)
+    print(str(frame_num) + ' frames x ' + str(len(variants)) + ' variants written')
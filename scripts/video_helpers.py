@@ -0,0 +1,161 @@
+import os
+import struct
+import shutil
+import subprocess
+
+# Streaming video writers, frames are appended as they are rendered so the video is
+# complete as soon as the last frame is.
+#   MJPEGAviWriter: pure python, stores the rendered JPEG frames as they are (no re-encoding)
+#   FFmpegWriter: pipes frames to an ffmpeg process, e.g. for MP4 output
+
+# ----------------------------------------------------------
+def get_jpeg_size(data):
+    # (width, height) from the SOF marker of a JPEG bitstream
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('Not a JPEG frame')
+    pos = 2
+    while pos < len(data) - 9:
+        if data[pos] != 0xFF:
+            pos += 1
+            continue
+        marker = data[pos+1]
+        if marker in [0xD8, 0x01] or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            pos += 2 if marker != 0xFF else 1
+            continue
+        seg_len = struct.unpack('>H', data[pos+2:pos+4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in [0xC4, 0xC8, 0xCC]:
+            height, width = struct.unpack('>HH', data[pos+5:pos+9])
+            return width, height
+        pos += 2 + seg_len
+    raise ValueError('No SOF marker found in JPEG frame')
+
+class MJPEGAviWriter:
+    # Motion-JPEG AVI (RIFF, AVI 1.0 with idx1 index), limited to 1GB files
+    AVIIF_KEYFRAME = 0x10
+    AVIF_HASINDEX = 0x10
+
+    def __init__(self, filepath, frame_rate):
+        self.filepath = filepath
+        self.frame_rate = frame_rate
+        self.file = open(filepath, "wb")
+        self.index = []
+        self.size = None
+        self.max_frame_bytes = 0
+        self.movi_pos = None
+
+    def _write_header(self, width, height):
+        us_per_frame = int(round(1e6 / self.frame_rate))
+        avih = struct.pack('<14I', us_per_frame, 0, 0, self.AVIF_HASINDEX, 0, 0, 1, 0, width, height, 0, 0, 0, 0)
+        strh = b'vids' + b'MJPG' + struct.pack('<IHHIIIIIIiI4h', 0, 0, 0, 0, 1, int(round(self.frame_rate)), 0, 0, 0, \
+                                               -1, 0, 0, 0, width, height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width*height*3, 0, 0, 0, 0)
+        strl = b'strl' + self._chunk(b'strh', strh) + self._chunk(b'strf', strf)
+        hdrl = b'hdrl' + self._chunk(b'avih', avih) + self._chunk(b'LIST', strl)
+        self.file.write(b'RIFF' + struct.pack('<I', 0) + b'AVI ')
+        self.file.write(self._chunk(b'LIST', hdrl))
+        self.file.write(b'LIST' + struct.pack('<I', 0))
+        self.movi_pos = self.file.tell()
+        self.file.write(b'movi')
+
+    @staticmethod
+    def _chunk(fourcc, data):
+        return fourcc + struct.pack('<I', len(data)) + data + (b'\x00' if len(data) % 2 else b'')
+
+    def add_jpeg(self, data):
+        if self.size is None:
+            self.size = get_jpeg_size(data)
+            self._write_header(*self.size)
+        self.index.append((self.file.tell() - self.movi_pos, len(data)))
+        self.max_frame_bytes = max(self.max_frame_bytes, len(data))
+        self.file.write(self._chunk(b'00dc', data))
+
+    def add_frame_file(self, img_fp):
+        if os.path.splitext(img_fp)[1].lower() not in ['.jpg', '.jpeg']:
+            raise ValueError('MJPEG AVI needs JPEG frames, use an ffmpeg container (e.g. .mp4) for ' + img_fp)
+        file = open(img_fp, "rb")
+        self.add_jpeg(file.read())
+        file.close()
+
+    def close(self):
+        if self.size is None: # no frames
+            self.file.close()
+            return
+        movi_end = self.file.tell()
+        idx1 = b''.join(struct.pack('<4sIII', b'00dc', self.AVIIF_KEYFRAME, offset, size) for offset, size in self.index)
+        self.file.write(self._chunk(b'idx1', idx1))
+        riff_end = self.file.tell()
+        # patch sizes and frame counts now that they are known
+        frame_num = len(self.index)
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', riff_end - 8))
+        self.file.seek(12 + 8 + 4 + 8 + 16) # RIFF hdr, LIST hdr, 'hdrl', 'avih' hdr, 4 fields -> dwTotalFrames
+        self.file.write(struct.pack('<I', frame_num))
+        self.file.seek(12 + 8 + 4 + 8 + 28) # dwSuggestedBufferSize
+        self.file.write(struct.pack('<I', self.max_frame_bytes))
+        strh_pos = 12 + 8 + 4 + 8 + 56 + 8 + 4 + 8 # ... 'avih' body, LIST hdr, 'strl', 'strh' hdr
+        self.file.seek(strh_pos + 32) # dwLength
+        self.file.write(struct.pack('<II', frame_num, self.max_frame_bytes))
+        self.file.seek(self.movi_pos - 4)
+        self.file.write(struct.pack('<I', movi_end - self.movi_pos))
+        self.file.close()
+
+# ----------------------------------------------------------
+class FFmpegWriter:
+    # frames are piped to ffmpeg as encoded images (input_codec='mjpeg'/'png') or raw
+    # uint8 RGB arrays (input_codec='rawvideo', frame_size=(width, height))
+    def __init__(self, filepath, frame_rate, input_codec='mjpeg', frame_size=None, ffmpeg_bin='ffmpeg', \
+                 output_args=('-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18')):
+        if shutil.which(ffmpeg_bin) is None:
+            raise ValueError('ffmpeg not found, needed for ' + filepath)
+        if input_codec == 'rawvideo':
+            input_args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', str(frame_size[0])+'x'+str(frame_size[1])]
+        else:
+            input_args = ['-f', 'image2pipe', '-c:v', input_codec]
+        cmd = [ffmpeg_bin, '-y', '-loglevel', 'error'] + input_args + ['-framerate', str(frame_rate), '-i', '-'] \
+              + list(output_args) + [filepath]
+        self.filepath = filepath
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def add_jpeg(self, data):
+        self.proc.stdin.write(data)
+
+    def add_frame_file(self, img_fp):
+        file = open(img_fp, "rb")
+        self.proc.stdin.write(file.read())
+        file.close()
+
+    def add_frame_array(self, img):
+        # img: HxWx3 uint8, top row first
+        self.proc.stdin.write(img.tobytes())
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise SystemExit('Error: ffmpeg failed to write ' + self.filepath)
+
+def get_input_codec(ext):
+    # ffmpeg codec of frame files; JPEG frames go into the MJPEG AVI as they are
+    return 'mjpeg' if ext.lower() in ['.jpg', '.jpeg'] else ext.lower()[1:]
+
+def check_video_input(ext, filepath='video_cysto.avi', ffmpeg_bin='ffmpeg'):
+    # before rendering: frames other than JPEG (or another container than AVI) are transcoded by ffmpeg
+    if (get_input_codec(ext) != 'mjpeg' or os.path.splitext(filepath)[1].lower() != '.avi') and shutil.which(ffmpeg_bin) is None:
+        raise ValueError('ffmpeg not found, needed for a video of ' + ext + ' frames (or render JPEG frames)')
+
+def open_video_writer(filepath, frame_rate, **kwargs):
+    if os.path.splitext(filepath)[1].lower() == '.avi' and kwargs.get('input_codec', 'mjpeg') == 'mjpeg':
+        return MJPEGAviWriter(filepath, frame_rate)
+    return FFmpegWriter(filepath, frame_rate, **kwargs)
+
+def get_video_path(frame_dir, vid_name):
+    # video goes next to the frame folder, i.e. into data_folder (as convert_frames2video.m did)
+    return os.path.dirname(os.path.normpath(frame_dir)) + '/' + vid_name
+
+def convert_frames2video(frame_dir, vid_name, frame_rate, ext='.jpg'):
+    names = sorted(name for name in os.listdir(frame_dir) if name.endswith(ext))
+    if not names:
+        raise ValueError('No ' + ext + ' frames in ' + frame_dir)
+    writer = open_video_writer(get_video_path(frame_dir, vid_name), frame_rate, input_codec=get_input_codec(ext))
+    for name in names:
+        writer.add_frame_file(frame_dir + '/' + name)
+    writer.close()